@@ -1,4 +1,12 @@
+import collections
+import concurrent.futures
+import multiprocessing
 import random
+import time
+
+import chessengine
+import chesseval
+import chesstablebase
 
 pieceScore = {
     'K': 0,
@@ -26,8 +34,19 @@ Space
 Tempo
 '''
 
-CHECKMATE = 1000 #positive is winning for white. negative is winning for black
+CHECKMATE = 100000 #positive is winning for white. negative is winning for black. Scores are in centipawns
 STALEMATE = 0
+DRAW = 0 #repetition, fifty-move rule or no mating material
+DEPTH = 4 #search depth when findBestMove is given no time limit
+MAX_DEPTH = 64
+MATE_BOUND = CHECKMATE - 1000 #scores past this are mates, tablebase mates can be further away than MAX_DEPTH
+WORKERS = 1 #processes findBestMove searches with, see splitSearch
+DELTA_MARGIN = 200 #centipawns a quiet position may swing by, see quiescence
+INSTABILITY_WEIGHT = 1.0 #soft time limit stretch per recent change of the best move, see iterativeDeepening
+INSTABILITY_DECAY = 0.5 #how much of the stretch is left after an iteration that kept the best move
+
+#pieceScore by piece index (chessengine.pieceNames order), for the packed moves of the search
+pieceValues = [pieceScore[name[1]] for name in chessengine.pieceNames]
 
 def findRandomMove(validMoves):
     return validMoves[random.randint(0, len(validMoves)-1)]
@@ -42,35 +61,658 @@ def scoreMaterial(board): #purely based on material, not position
                 score-= pieceScore[square[1]] #based on the piece score
     return score
 
-def findBestMove(gs, validMoves):
+'''
+Pawn hash table
+Pawn structure changes far less often than the rest of the position, thousands of leaves
+share the same pawns. Its score is cached under GameState.pawnKey in a fixed number of slots
+(key % size picks one); a new pawn structure always evicts whatever was in its slot, the most
+recent structures are the ones the search is about to see again.
+'''
+class PawnTable():
+    def __init__(self, size=1 << 14):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.keys = [None]*self.size
+        self.scores = [0]*self.size
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, gs):
+        #packed pawn structure score of gs, from white's point of view
+        key = gs.pawnKey
+        i = key % self.size
+        if self.keys[i] == key:
+            self.hits += 1
+            return self.scores[i]
+        self.misses += 1
+        score = chesseval.evaluatePawns(gs.pieceBB[chessengine.WP], gs.pieceBB[chessengine.BP])
+        self.keys[i] = key
+        self.scores[i] = score
+        return score
+
+pawnTable = PawnTable()
+
+def evaluate(gs):
+    '''
+    Static score from white's point of view: material and piece-square tables (GameState keeps
+    the sums, so this is O(1)), the cached pawn structure and the pawn shield of both kings.
+    '''
+    pieceBB = gs.pieceBB
+    score = gs.psqScore + pawnTable.score(gs)
+    score += chesseval.kingShield(chessengine.WHITE, chessengine.lsb(pieceBB[chessengine.WK]), pieceBB[chessengine.WP])
+    score -= chesseval.kingShield(chessengine.BLACK, chessengine.lsb(pieceBB[chessengine.BK]), pieceBB[chessengine.BP])
+    return chesseval.taper(score, gs.phase)
+
+'''
+Evaluation cache
+evaluate results by Zobrist key, in front of evaluate in the search. Its size is capped in
+megabytes, turned into an entry count with the measured cost of one entry, and when it is full
+the least recently used position is evicted. Kept alive across the moves of a game, much of what
+the search scored on the last move is scored again on this one.
+'''
+EVAL_ENTRY_BYTES = 176 #one OrderedDict entry with its key and score, measured with tracemalloc
+
+class EvalCache():
+    def __init__(self, megabytes=16):
+        self.maxEntries = max(1, megabytes*(1 << 20) // EVAL_ENTRY_BYTES)
+        self.clear()
+
+    def clear(self):
+        self.entries = collections.OrderedDict() #oldest use first
+        self.hits = 0
+        self.misses = 0
+
+    def score(self, gs):
+        #evaluate(gs), from the cache when the position has been scored before
+        key = gs.zobristKey
+        entries = self.entries
+        score = entries.pop(key, None) #pop and put back moves it to the most recent end
+        if score is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            score = evaluate(gs)
+            if len(entries) >= self.maxEntries:
+                entries.popitem(last=False)
+        entries[key] = score
+        return score
+
+    def stats(self):
+        #counters for display and tuning
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses, 'entries': len(self.entries),
+                'maxEntries': self.maxEntries, 'hitRate': self.hits / lookups if lookups else 0.0}
+
+evaluationCache = EvalCache() #kept between moves of a game, unless findBestMove is given another
+
+'''
+Transposition table
+Search results stored by Zobrist key, so a position reached again - by another move order,
+or on the next move of the game - is not searched from scratch.
+Every slot keeps the key, the depth searched, the bound type, the score and the best move.
+The table has a fixed number of slots (key % size picks one) kept in parallel lists,
+and replacement is depth-preferred: a slot is only overwritten by an equal or deeper
+search, unless its entry is left over from an earlier move of the game.
+'''
+EXACT = 0 #score is exact
+LOWERBOUND = 1 #search failed high, the real score is at least this
+UPPERBOUND = 2 #search failed low, the real score is at most this
+
+class TranspositionTable():
+    def __init__(self, size=1 << 18):
+        self.size = size
+        self.clear()
+
+    def clear(self):
+        self.keys = [0]*self.size
+        self.depths = [-1]*self.size
+        self.flags = [EXACT]*self.size
+        self.scores = [0]*self.size
+        self.moves = [None]*self.size
+        self.ages = [0]*self.size
+        self.age = 0
+
+    def newSearch(self):
+        #entries from older searches can be replaced regardless of depth
+        self.age += 1
+
+    def probe(self, key):
+        #(depth, flag, score, move) stored for key, or None
+        i = key % self.size
+        if self.keys[i] != key or self.depths[i] < 0:
+            return None
+        return self.depths[i], self.flags[i], self.scores[i], self.moves[i]
+
+    def store(self, key, depth, flag, score, move):
+        i = key % self.size
+        if self.keys[i] != key and depth < self.depths[i] and self.ages[i] == self.age:
+            return #keep the deeper result
+        if move is None and self.keys[i] == key:
+            move = self.moves[i] #a fail-low has no best move, keep the one found before
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.flags[i] = flag
+        self.scores[i] = score
+        self.moves[i] = move
+        self.ages[i] = self.age
+
+transpositionTable = TranspositionTable() #kept between moves of a game
+
+def scoreToTable(score, ply):
+    #mate scores count plies from the root, the table stores them counted from the position itself
+    if score >= MATE_BOUND:
+        return score + ply
+    if score <= -MATE_BOUND:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_BOUND:
+        return score - ply
+    if score <= -MATE_BOUND:
+        return score + ply
+    return score
+
+'''
+Search
+Negamax with alpha-beta pruning, run by iterative deepening: depth 1, 2, 3... each iteration
+starts with the best line of the one before, so the pruning finds its cut-offs early.
+The search stops when the depth limit is reached, the wall clock deadline runs out or the
+node limit is used up, and the best move of the last finished iteration is played.
+With a soft time limit as well (see chessclock) no new iteration is started once it is
+used up - later if the best move has just changed, the search hasn't settled yet.
+'''
+class SearchInfo():
+    #bookkeeping shared by every node of one search
+    def __init__(self, deadline=None):
+        self.deadline = deadline #time.time() value to stop at, None for no limit
+        self.startTime = time.time()
+        self.softTime = None #seconds after startTime not to start another iteration past, None for no limit
+        self.nodes = 0
+        self.maxNodes = None #nodes to stop at, None for no limit - a limit that doesn't depend on the machine
+        self.depth = 0 #last finished iteration
+        self.stopped = False
+        self.stopEvent = None #shared Event of a parallel search worker, set by the parent to stop it
+        self.pv = [] #principal variation (best line) of the last finished iteration
+        self.killers = [[None, None] for _ in range(MAX_DEPTH)] #two quiet moves per ply that caused a cut-off
+        self.history = [0]*4096 #butterfly table - cut-off score of every quiet move by start and end square
+        self.evalCache = evaluationCache
+        self.tablebases = None #chesstablebase.Tablebases for exact scores with three pieces or fewer
+        self.report = None #called as report(info, score) after every finished iteration, e.g. for UCI info lines
+
+    def stop(self):
+        #called from another thread to end the search early, findBestMove still returns a move
+        self.stopped = True
+
+    def checkTime(self):
+        #the limits are only checked every 1024 nodes, time.time() is not free
+        if self.nodes & 1023 == 0:
+            if self.deadline is not None and time.time() >= self.deadline:
+                self.stopped = True
+            elif self.maxNodes is not None and self.nodes >= self.maxNodes:
+                self.stopped = True
+            elif self.stopEvent is not None and self.stopEvent.is_set():
+                self.stopped = True
+        return self.stopped
+
+def findBestMove(gs, validMoves, depth=None, moveTime=None, workers=None, seed=None, info=None, evalCache=None, book=None, tablebases=None, softTime=None, nodes=None):
+    '''
+    Returns the best move found for the side to move, as one of the Move objects in validMoves.
+    depth caps the iterative deepening, moveTime is the wall clock budget in seconds.
+    With neither given it searches to DEPTH.
+    softTime goes with moveTime, as the soft limit of chessclock.allocateTime.
+    nodes caps the nodes searched, so the result doesn't depend on the speed of the machine.
+    workers above 1 splits the root moves across that many processes (see splitSearch).
+    seed fixes the order of equal moves, with a depth limit the result is then always the same
+    for the same transposition table and number of workers.
+    info is an optional SearchInfo, so another thread can watch the depth and nodes or stop the search.
+    evalCache is the EvalCache to score positions through, evaluationCache by default.
+    book is an optional chessbook.OpeningBook - while the position is in it a book move is
+    played without searching.
+    tablebases is an optional chesstablebase.Tablebases - a position in the tables is played
+    from them without searching, and the search scores the positions it reaches in them exactly.
+    The search itself runs on the packed moves of GameState.generateMoves.
+    '''
+    if len(validMoves) == 0:
+        return None
+    if depth is None:
+        depth = MAX_DEPTH if moveTime is not None or nodes else DEPTH
+    if workers is None:
+        workers = WORKERS
+    if info is None:
+        info = SearchInfo()
+    if evalCache is not None:
+        info.evalCache = evalCache
+    if tablebases is not None:
+        info.tablebases = tablebases
+    if moveTime is not None: #without moveTime the limits of info are kept, another thread may set them later
+        info.startTime = time.time()
+        info.deadline = info.startTime + moveTime
+        info.softTime = softTime
+    if nodes:
+        info.maxNodes = nodes
+    rng = random.Random(seed) if seed is not None else random
+    if book is not None:
+        bookMove = book.pickMove(gs, rng)
+        if bookMove is not None:
+            info.pv = [bookMove]
+            return moveFromCode(validMoves, bookMove)
+    if info.tablebases is not None:
+        tablebaseMove = pickTablebaseMove(gs, info.tablebases)
+        if tablebaseMove is not None:
+            info.pv = [tablebaseMove]
+            return moveFromCode(validMoves, tablebaseMove)
+    rootMoves = gs.generateMoves()
+    #equal moves are played in a random order, so games differ
+    rng.shuffle(rootMoves)
+
+    transpositionTable.newSearch()
+    results = iterativeDeepening(gs, rootMoves, depth, info, workers)
+    bestMove = results[-1][1][0] if results else rootMoves[0]
+    return moveFromCode(validMoves, bestMove)
+
+def pickTablebaseMove(gs, tablebases):
+    '''
+    The move the tables say is best, or None when the position isn't in them:
+    the quickest mate, else a draw, else the loss that takes longest.
+    '''
+    if tablebases.probe(gs) is None:
+        return None
+    bestMove = None
+    bestRank = None
+    for move in gs.generateMoves():
+        gs.pushMove(move)
+        result = tablebases.probe(gs)
+        gs.popMove()
+        if result is None: #every move out of a table position lands in one, but stay safe
+            return None
+        outcome, plies = result
+        #ranked from the mover's side, the opponent's loss is our win
+        if outcome == chesstablebase.LOSS:
+            rank = (2, -plies)
+        elif outcome == chesstablebase.DRAW:
+            rank = (1, 0)
+        else:
+            rank = (0, plies)
+        if bestRank is None or rank > bestRank:
+            bestMove, bestRank = move, rank
+    return bestMove
+
+def tablebaseScore(gs, info, ply):
+    #exact score for the side to move if the position is in the tables, else None
+    if info.tablebases is None:
+        return None
+    result = info.tablebases.probe(gs)
+    if result is None:
+        return None
+    outcome, plies = result
+    if outcome == chesstablebase.WIN:
+        return CHECKMATE - ply - plies
+    if outcome == chesstablebase.LOSS:
+        return -CHECKMATE + ply + plies
+    return DRAW
+
+def iterativeDeepening(gs, rootMoves, depth, info, workers=1):
+    '''
+    Searches rootMoves to depth 1, 2, 3... until depth or the deadline in info.
+    With workers above 1 the deeper iterations are split across processes (see splitSearch).
+    Returns (score, line) of every finished iteration, the last one is the deepest.
+    '''
+    results = []
     turnMultiplier = 1 if gs.whiteToMove else -1
+    instability = 0.0
+    for d in range(1, depth + 1):
+        iterationStart = time.time()
+        line = []
+        if workers > 1 and d >= SPLIT_DEPTH:
+            score = splitSearch(gs, rootMoves, d, turnMultiplier, info, workers, line)
+        else:
+            score = negamax(gs, rootMoves, d, -CHECKMATE - 1, CHECKMATE + 1, turnMultiplier, info, 0, line)
+        if info.stopped: #an unfinished iteration can't be trusted, keep the last full one
+            break
+        info.depth = d
+        info.pv = line
+        results.append((score, line))
+        if info.report is not None:
+            info.report(info, score)
+        if abs(score) >= MATE_BOUND: #forced mate found, deeper search won't change it
+            break
+        instability *= INSTABILITY_DECAY
+        if len(results) > 1 and line[0] != results[-2][1][0]:
+            instability += 1
+        softTime = info.softTime
+        if softTime is not None and time.time() - info.startTime >= softTime*(1 + INSTABILITY_WEIGHT*instability):
+            break
+        if info.deadline is not None:
+            #the next iteration takes several times longer than this one, don't start what can't finish
+            remaining = info.deadline - time.time()
+            if remaining < 2*(time.time() - iterationStart):
+                break
+    return results
+
+'''
+Parallel search
+Every iteration from SPLIT_DEPTH on is split at the root. The parent searches the best move
+of the iteration before on its own first, then the other moves are dealt out round-robin to
+worker processes with that move's score as alpha - most of them only have to prove they are
+no better, which takes far fewer nodes than finding their exact score. Only a move that beats
+alpha comes back with a line, and workers are merged in a fixed order with ties going to
+the first, so the parent's move stands unless a worker's move is really better.
+Iterative deepening, the time limits and the report stay with the parent, the workers get
+one depth of one share at a time. Each worker rebuilds the position from a GameState
+snapshot and starts every task with an empty transposition table: which process the pool
+hands a share to is up to the pool, and a table left over from another share could change
+the scores. Every task sees the same tables on every run, so with a depth limit and a seed
+the move is the same on every run with the same number of workers, as it is with one.
+The workers can't see the parent's SearchInfo, so a stop() or a deadline set after the search
+started (a ponder hit) reaches them through a shared Event the parent sets while it waits.
+The tablebases go by their directory, every worker opens them once and keeps them, so its
+moves are scored as exactly as the parent's.
+'''
+SPLIT_DEPTH = 3 #shallower iterations cost less than handing them to the workers
+STOP_POLL = 0.02 #seconds between the parent's checks of the stop flag and the deadline
+_pool = None
+_poolWorkers = 0
+_manager = None
+_stopEvent = None
+_workerTablebases = None #the tables a worker process has open, see workerTablebases
+
+def getPool(workers):
+    #the pool is started once and kept, starting processes costs more than a short search
+    global _pool, _poolWorkers, _manager, _stopEvent
+    if _pool is None or _poolWorkers != workers:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        _poolWorkers = workers
+    if _manager is None:
+        _manager = multiprocessing.Manager()
+        _stopEvent = _manager.Event()
+    return _pool
+
+def workerTablebases(directory):
+    #the worker's tables, opened again only when the parent's directory changes
+    global _workerTablebases
+    current = _workerTablebases.directory if _workerTablebases is not None else None
+    if directory != current:
+        if _workerTablebases is not None:
+            _workerTablebases.close()
+        _workerTablebases = chesstablebase.openTablebases(directory)
+    return _workerTablebases
+
+def searchWorker(snapshot, rootMoves, depth, alpha, deadline, maxNodes, stopEvent, tablebasePath):
+    #runs in a worker process: one iteration over a share of the root moves, line stays empty unless a move beats alpha
+    gs = chessengine.GameState.fromSnapshot(snapshot)
+    info = SearchInfo(deadline)
+    info.maxNodes = maxNodes
+    info.stopEvent = stopEvent
+    info.tablebases = workerTablebases(tablebasePath)
+    transpositionTable.clear()
+    line = []
+    score = negamax(gs, rootMoves, depth, alpha, CHECKMATE + 1, 1 if gs.whiteToMove else -1, info, 0, line)
+    return score, line, info.nodes, info.stopped
+
+def splitSearch(gs, rootMoves, depth, turnMultiplier, info, workers, line):
+    #one iteration of iterativeDeepening across the workers, fills line and returns the score like negamax
+    first = info.pv[0] #set by the iterations below SPLIT_DEPTH
+    score = negamax(gs, [first], depth, -CHECKMATE - 1, CHECKMATE + 1, turnMultiplier, info, 0, line)
+    if info.stopped:
+        return 0
+    rest = [move for move in rootMoves if move != first]
+    shares = [rest[i::workers] for i in range(workers) if rest[i::workers]]
+    if not shares:
+        return score
+    pool = getPool(workers)
+    _stopEvent.clear()
+    snapshot = gs.getSnapshot()
+    maxNodes = (info.maxNodes - info.nodes) // len(shares) if info.maxNodes is not None else None
+    tablebasePath = info.tablebases.directory if info.tablebases is not None else None
+    futures = [pool.submit(searchWorker, snapshot, share, depth, score, info.deadline, maxNodes, _stopEvent, tablebasePath)
+               for share in shares]
+    pending = set(futures)
+    while pending:
+        done, pending = concurrent.futures.wait(pending, timeout=STOP_POLL)
+        if info.stopped or (info.deadline is not None and time.time() >= info.deadline):
+            _stopEvent.set()
+    for future in futures:
+        workerScore, workerLine, nodes, stopped = future.result()
+        info.nodes += nodes
+        if stopped: #the iteration is unfinished, iterativeDeepening drops it
+            info.stopped = True
+        elif workerLine and workerScore > score:
+            score = workerScore
+            line[:] = workerLine
+    return score
+
+def moveFromCode(validMoves, code):
+    #the Move object of validMoves that a packed move stands for
+    for move in validMoves:
+        if move.getCode() == code:
+            return move
+    return None
+
+'''
+Move ordering
+Alpha-beta prunes the most when the best move is searched first. orderMoves hands the moves
+out in stages: the hash move, then captures and promotions by MVV-LVA (most valuable victim,
+least valuable attacker), then the killer moves of the ply, then the other quiet moves
+by their history score. It is a generator, so a stage is only sorted when the search
+gets to it - after a cut-off on the hash move nothing else is scored at all.
+'''
+def orderMoves(gs, moves, firstMove, ply, info):
+    if firstMove is not None and firstMove in moves:
+        yield firstMove
+
+    mailbox = gs.mailbox
+    captures = []
+    quiets = []
+    for move in moves:
+        if move == firstMove:
+            continue
+        if move >> 12 & 12: #capture or promotion flag
+            captures.append(move)
+        else:
+            quiets.append(move)
+
+    if captures:
+        captures.sort(key=lambda move: mvvLva(mailbox, move), reverse=True)
+        for move in captures:
+            yield move
+
+    for killer in info.killers[ply]:
+        if killer is not None and killer != firstMove and killer in quiets:
+            quiets.remove(killer)
+            yield killer
+
+    history = info.history
+    quiets.sort(key=lambda move: history[move & 4095], reverse=True)
+    for move in quiets:
+        yield move
+
+def captureGain(mailbox, move):
+    #material a move wins on its own, before any recapture
+    flag = move >> 12
+    if flag == chessengine.EN_PASSANT:
+        return pieceScore['p']
+    victim = mailbox[move >> 6 & 63]
+    gain = pieceValues[victim] if victim != chessengine.EMPTY else 0
+    if flag & 8: #promotion, the new piece counts as won material
+        gain += pieceScore[chessengine.promotionPieces[flag & 3]] - pieceScore['p']
+    return gain
+
+def mvvLva(mailbox, move):
+    return 10*captureGain(mailbox, move) - pieceValues[mailbox[move & 63]]
+
+'''
+Static exchange evaluation
+The material a capture wins once both sides have recaptured on its square as often as they
+like, always with their least valuable piece, each side free to stop when going on loses.
+Sliders behind a capturing piece join in (x-rays) because the attackers are looked up again
+on the occupancy with every captured piece removed.
+'''
+def staticExchange(gs, move):
+    mailbox = gs.mailbox
+    pieceBB = gs.pieceBB
+    frm = move & 63
+    to = move >> 6 & 63
+    flag = move >> 12
+    gains = [captureGain(mailbox, move)]
+    onSquare = pieceValues[mailbox[frm]] #value of the piece standing on the square, next to be taken
+    if flag & 8:
+        onSquare = pieceScore[chessengine.promotionPieces[flag & 3]]
+    occ = (gs.colourBB[0] | gs.colourBB[1]) ^ (1 << frm)
+    if flag == chessengine.EN_PASSANT:
+        occ ^= 1 << (to + (8 if gs.whiteToMove else -8))
+    side = 1 if gs.whiteToMove else 0 #the side that recaptures next
+    while True:
+        attackers = gs.attackersTo(to, side, occ) & occ
+        if not attackers:
+            break
+        base = 6*side
+        for piece in range(base, base + 6): #least valuable attacker first, the king last
+            bb = attackers & pieceBB[piece]
+            if bb:
+                break
+        occ ^= bb & -bb
+        if piece == base + 5 and gs.attackersTo(to, side ^ 1, occ) & occ:
+            break #the king can't take a defended piece
+        gains.append(onSquare - gains[-1])
+        onSquare = pieceValues[piece]
+        side ^= 1
+    #each side picks the better of stopping and recapturing, from the last capture back
+    while len(gains) > 1:
+        last = gains.pop()
+        gains[-1] = -max(-gains[-1], last)
+    return gains[0]
+
+'''
+Quiescence search
+At depth 0 the search doesn't stop in the middle of an exchange - it keeps going through
+captures and promotions until the position is quiet. The side to move may stand pat
+(take the static score) instead of capturing, unless it is in check. Captures that can't
+bring the score back up to alpha even with DELTA_MARGIN to spare (delta pruning), and
+captures that lose material by static exchange, are not searched.
+'''
+def quiescence(gs, alpha, beta, turnMultiplier, info, ply):
+    info.nodes += 1
+    if info.checkTime():
+        return 0
+    #the children of a depth 1 node come straight here, and so do quiet check evasions
+    if gs.isRepetition() or gs.isInsufficientMaterial():
+        return DRAW
+    score = tablebaseScore(gs, info, ply)
+    if score is not None:
+        return score
+    moves = gs.generateMoves(capturesOnly=True)
+    inCheck = gs.in_check
+    if inCheck and len(moves) == 0:
+        return -CHECKMATE + ply
+    if gs.halfmoveClock >= 100: #checked after mate, mate on the hundredth halfmove still counts
+        return DRAW
+    if inCheck:
+        bestScore = -CHECKMATE - 1
+    else:
+        standPat = turnMultiplier * info.evalCache.score(gs)
+        if standPat >= beta:
+            return standPat
+        if standPat > alpha:
+            alpha = standPat
+        bestScore = standPat
+
+    mailbox = gs.mailbox
+    moves.sort(key=lambda move: mvvLva(mailbox, move), reverse=True)
+    for move in moves:
+        if not inCheck:
+            if standPat + 100*captureGain(mailbox, move) + DELTA_MARGIN <= alpha:
+                continue
+            if staticExchange(gs, move) < 0:
+                continue
+        gs.pushMove(move)
+        score = -quiescence(gs, -beta, -alpha, -turnMultiplier, info, ply + 1)
+        gs.popMove()
+        if info.stopped:
+            return 0
+        if score > bestScore:
+            bestScore = score
+            if score > alpha:
+                alpha = score
+        if alpha >= beta:
+            break
+    return bestScore
+
+def negamax(gs, moves, depth, alpha, beta, turnMultiplier, info, ply, line):
+    '''
+    Score of the position for the side to move (turnMultiplier is 1 for white, -1 for black).
+    moves are the packed valid moves of the position, line is filled with the best line found.
+    '''
+    info.nodes += 1
+    if info.checkTime():
+        return 0
+    if len(moves) == 0:
+        if gs.in_check:
+            return -CHECKMATE + ply #prefer the quickest mate, and the slowest loss
+        return STALEMATE
+    if ply > 0:
+        #a repeated line is a draw already, searching it on only finds the same positions again
+        if gs.isRepetition() or gs.halfmoveClock >= 100 or gs.isInsufficientMaterial():
+            return DRAW
+        score = tablebaseScore(gs, info, ply)
+        if score is not None:
+            return score
+    if depth == 0:
+        return quiescence(gs, alpha, beta, turnMultiplier, info, ply)
+
+    key = gs.zobristKey
+    alphaOrig = alpha
+    hashMove = None
+    entry = transpositionTable.probe(key)
+    if entry is not None:
+        ttDepth, ttFlag, ttScore, hashMove = entry
+        if ply > 0 and ttDepth >= depth: #the root always searches, it has to return a line
+            ttScore = scoreFromTable(ttScore, ply)
+            if ttFlag == EXACT:
+                return ttScore
+            if ttFlag == LOWERBOUND and ttScore >= beta:
+                return ttScore
+            if ttFlag == UPPERBOUND and ttScore <= alpha:
+                return ttScore
+
+    #hash move first, else the previous iteration's best line
+    firstMove = hashMove if hashMove is not None else (info.pv[ply] if ply < len(info.pv) else None)
+    bestScore = -CHECKMATE - 1
     bestMove = None
-    random.shuffle(validMoves)
-    opponentMinMaxScore = CHECKMATE #best score for black
-    for playerMove in validMoves:
-        gs.makeMove(playerMove)
-        opponentMoves = gs.getValidMoves()
-        opponentMaxScore = -CHECKMATE #best score for white
-        for opponentMove in opponentMoves:
-            gs.makeMove(opponentMove)
-
-            if gs.checkmate:
-                score = -turnMultiplier * CHECKMATE
-            if gs.stalemate:
-                score = STALEMATE
-            else:
-                score = -turnMultiplier * scoreMaterial(gs.board) #neg or pos compared to position
-            #if white is winning by 5 points, and white to move, the score is 5, else if BTM then -5
-            #if black is winning by 5 points, and black to move, the score is -5, else if WTM then 5
-            #Score is just a magnitude
-
-            if score > opponentMaxScore: #if the looping score is better than the best scenario so far, then make it equal to the best scenario
-                opponentMaxScore = score #compare the looping score to the best scenario ^
-            gs.undoMove()
-        if opponentMinMaxScore > opponentMaxScore: 
-            # if opponent max score is less than their previous max,
-            # this is advantageous to the bot 'US' so this is our best move.
-            opponentMinMaxScore = opponentMaxScore
-            bestPlayerMove = playerMove
-        gs.undoMove()
-    return bestPlayerMove
+    for move in orderMoves(gs, moves, firstMove, ply, info):
+        gs.pushMove(move)
+        childLine = []
+        if depth > 1:
+            score = -negamax(gs, gs.generateMoves(), depth - 1, -beta, -alpha, -turnMultiplier, info, ply + 1, childLine)
+        else: #quiescence generates its own captures
+            score = -quiescence(gs, -beta, -alpha, -turnMultiplier, info, ply + 1)
+        gs.popMove()
+        if info.stopped:
+            return 0
+        if score > bestScore:
+            bestScore = score
+            if score > alpha:
+                alpha = score
+                bestMove = move
+                line[:] = [move] + childLine
+        if alpha >= beta: #the opponent won't allow this line, no need to look at the rest
+            if not move >> 12 & 12: #a quiet move that refutes here likely refutes sibling positions too
+                killers = info.killers[ply]
+                if killers[0] != move:
+                    killers[1] = killers[0]
+                    killers[0] = move
+                info.history[move & 4095] += depth*depth
+            break
+
+    if bestScore <= alphaOrig:
+        flag = UPPERBOUND
+    elif bestScore >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    transpositionTable.store(key, depth, flag, scoreToTable(bestScore, ply), bestMove)
+    return bestScore
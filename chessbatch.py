@@ -0,0 +1,254 @@
+'''
+Batch evaluation - scores thousands of positions at once with NumPy, for analysis and training
+jobs that don't need a search. NumPy is only needed by this module, the game and the bot run without it.
+
+A batch of positions is either
+  (N, 64) int8 - the piece on every square: chessengine.pieceNames index + 1, 0 for an empty square
+  (N, 12, 64) int8 - one 0/1 plane per piece type, in chessengine.pieceNames order
+Both use the square layout of GameState.board, square = row*8 + col.
+
+evaluateBatch gives the same scores as chessai.evaluate (material, piece-square tables,
+pawn structure, pawn shield) and can add a mobility estimate on top that the search doesn't use.
+
+python chessbatch.py -n 10000               benchmark against chessai.evaluate
+python chessbatch.py --fens positions.fen   the same on the positions of a file, one FEN per line
+'''
+import argparse
+import random
+import sys
+import time
+
+import numpy as np
+
+import chessai
+import chessengine
+import chesseval
+from chessbitboard import WHITE, BLACK, KNIGHT_ATTACKS, KING_ATTACKS, DIRECTIONS, RAYS, WP, WN, WB, WR, WQ, WK, BP, BN, BB, BR, BQ, BK
+
+'''
+Encoding
+The converters fill a preallocated array when out is given, so a job scoring many batches
+doesn't allocate one per batch. GameState.mailbox is the int form of GameState.board.
+'''
+PIECE_CODES = np.arange(1, 13, dtype=np.int8)
+
+def encodeSquares(states, out=None):
+    #(N, 64) encoding of a list of GameStates
+    n = len(states)
+    if out is None:
+        out = np.empty((n, 64), dtype=np.int8)
+    out[:n] = [gs.mailbox for gs in states]
+    out[:n] += 1
+    return out[:n]
+
+def squaresToPlanes(squares, out=None):
+    #(N, 64) encoding to (N, 12, 64)
+    n = len(squares)
+    if out is None:
+        out = np.empty((n, 12, 64), dtype=np.int8)
+    out[:n] = squares[:, None, :] == PIECE_CODES[None, :, None]
+    return out[:n]
+
+def encodePlanes(states, out=None):
+    #(N, 12, 64) encoding of a list of GameStates
+    return squaresToPlanes(encodeSquares(states), out)
+
+'''
+Tables - the chesseval tables unpacked into arrays.
+The matrix products run in float32, which NumPy hands to BLAS; the values are small whole
+numbers, so they come out exact.
+'''
+#PIECE_SQUARE[piece*64 + sq] - middlegame and endgame column
+PIECE_SQUARE = np.array([[chesseval.middlegame(score), chesseval.endgame(score)] for table in chesseval.pieceSquare for score in table], dtype=np.float32)
+PHASE_WEIGHT = np.array(chesseval.phaseWeight, dtype=np.int32)
+PASSED_MG = np.array([chesseval.middlegame(score) for score in chesseval.passedPawn], dtype=np.int32)
+PASSED_EG = np.array([chesseval.endgame(score) for score in chesseval.passedPawn], dtype=np.int32)
+
+def _squareMatrix(table, dtype=np.float32):
+    #(64, 64) 0/1 matrix of a bitboard table, row = from square, column = to square
+    return np.array([[bb >> sq & 1 for sq in range(64)] for bb in table], dtype=dtype)
+
+#SHIELD_MASKS[colour][distance-1][kingSq] - the pawn shield squares distance rows in front of the king
+SHIELD_MASKS = [[_squareMatrix([chesseval.SHIELD[colour][sq][i] for sq in range(64)], np.int8) for i in range(2)] for colour in (WHITE, BLACK)]
+
+'''
+Mobility estimate
+Empty squares next to each piece in the directions it moves (every knight target for knights).
+It costs a matrix product per piece type instead of generating moves, and follows real mobility
+closely enough to rank positions.
+'''
+MOBILITY_WEIGHT = 4 #centipawns per square
+_diagonalSteps = [sum(RAYS[d][sq] & KING_ATTACKS[sq] for d in range(8) if DIRECTIONS[d][0] and DIRECTIONS[d][1]) for sq in range(64)]
+_straightSteps = [sum(RAYS[d][sq] & KING_ATTACKS[sq] for d in range(8) if not (DIRECTIONS[d][0] and DIRECTIONS[d][1])) for sq in range(64)]
+MOBILITY_MATRIX = {
+    'N': _squareMatrix(KNIGHT_ATTACKS),
+    'B': _squareMatrix(_diagonalSteps),
+    'R': _squareMatrix(_straightSteps),
+    'Q': _squareMatrix(KING_ATTACKS),
+}
+MOBILITY_PIECES = (('N', WN, BN), ('B', WB, BB), ('R', WR, BR), ('Q', WQ, BQ))
+
+'''
+Pawn structure, the same terms as chesseval.evaluatePawns on (N, 8, 8) boards of rows and files.
+Black's pawns are scored on boards flipped top to bottom, so both sides move up the board.
+'''
+def _adjacentFiles(files):
+    #(N, 8) - true where a file next to it is true
+    out = np.zeros_like(files)
+    out[:, 1:] |= files[:, :-1]
+    out[:, :-1] |= files[:, 1:]
+    return out
+
+def _pawnSide(own, enemy):
+    #packed score as (mg, eg) arrays for own pawns moving towards row 0
+    counts = own.sum(axis=1) #(N, 8) pawns per file
+    onFile = counts > 0
+    neighbours = _adjacentFiles(onFile)
+
+    doubled = np.maximum(counts - 1, 0).sum(axis=1)
+    isolated = (counts * ~neighbours).sum(axis=1)
+
+    #the front pawn of a file is passed when no enemy pawn is ahead of it on its own or the next files
+    front = np.where(onFile, own.argmax(axis=1), 8) #row of the front pawn, argmax finds the lowest row
+    enemyFront = np.where(enemy.any(axis=1), enemy.argmax(axis=1), 8)
+    spanFront = enemyFront.copy() #lowest enemy row on the file or the files next to it
+    spanFront[:, 1:] = np.minimum(spanFront[:, 1:], enemyFront[:, :-1])
+    spanFront[:, :-1] = np.minimum(spanFront[:, :-1], enemyFront[:, 1:])
+    passed = onFile & (spanFront >= front)
+    rank = np.where(passed, 7 - front, 0)
+    passedMg = np.where(passed, PASSED_MG[rank], 0).sum(axis=1)
+    passedEg = np.where(passed, PASSED_EG[rank], 0).sum(axis=1)
+
+    #backward - no own pawn level with or behind it on the next files, and its stop square is attacked by a pawn
+    behind = np.logical_or.accumulate(own[:, ::-1, :], axis=1)[:, ::-1, :] #own pawn on this square or further back on the file
+    support = np.zeros_like(own)
+    support[:, :, 1:] |= behind[:, :, :-1]
+    support[:, :, :-1] |= behind[:, :, 1:]
+    stopAttacked = np.zeros_like(own)
+    stopAttacked[:, 2:, 1:] |= enemy[:, :-2, :-1]
+    stopAttacked[:, 2:, :-1] |= enemy[:, :-2, 1:]
+    backward = (own & neighbours[:, None, :] & ~support & stopAttacked).sum(axis=(1, 2))
+
+    mg = doubled*chesseval.middlegame(chesseval.doubledPawn) + isolated*chesseval.middlegame(chesseval.isolatedPawn) \
+        + backward*chesseval.middlegame(chesseval.backwardPawn) + passedMg
+    eg = doubled*chesseval.endgame(chesseval.doubledPawn) + isolated*chesseval.endgame(chesseval.isolatedPawn) \
+        + backward*chesseval.endgame(chesseval.backwardPawn) + passedEg
+    return mg, eg
+
+def pawnTerms(planes):
+    #(mg, eg) arrays of the pawn structure and pawn shields, from white's point of view
+    n = len(planes)
+    whitePawns = planes[:, WP].astype(bool).reshape(n, 8, 8)
+    blackPawns = planes[:, BP].astype(bool).reshape(n, 8, 8)
+    whiteMg, whiteEg = _pawnSide(whitePawns, blackPawns)
+    blackMg, blackEg = _pawnSide(blackPawns[:, ::-1, :], whitePawns[:, ::-1, :])
+    mg = whiteMg - blackMg
+    eg = whiteEg - blackEg
+
+    for colour, king, pawns, sign in ((WHITE, WK, WP, 1), (BLACK, BK, BP, -1)):
+        kingSquares = planes[:, king].argmax(axis=1)
+        for distance in range(2):
+            count = (SHIELD_MASKS[colour][distance][kingSquares] & planes[:, pawns]).sum(axis=1, dtype=np.int32)
+            mg = mg + sign*count*chesseval.middlegame(chesseval.shieldPawn[distance])
+            eg = eg + sign*count*chesseval.endgame(chesseval.shieldPawn[distance])
+    return mg, eg
+
+def mobilityTerm(planes):
+    #mobility estimate in centipawns from white's point of view
+    empty = 1 - planes.sum(axis=1, dtype=np.float32) #(N, 64)
+    score = np.zeros(len(planes), dtype=np.float32)
+    for kind, white, black in MOBILITY_PIECES:
+        #white minus black pieces of the kind, one product covers both sides
+        pieces = planes[:, white].astype(np.float32) - planes[:, black]
+        score += ((pieces @ MOBILITY_MATRIX[kind]) * empty).sum(axis=1)
+    return np.rint(score).astype(np.int32)*MOBILITY_WEIGHT
+
+def evaluateBatch(positions, mobility=True):
+    '''
+    Scores of a batch in centipawns from white's point of view, as an (N,) int32 array.
+    positions is an (N, 64) or (N, 12, 64) int8 array (see the encoding at the top).
+    With mobility=False the scores are exactly those of chessai.evaluate.
+    '''
+    if positions.ndim == 2:
+        positions = squaresToPlanes(positions)
+    n = len(positions)
+    pieceSquare = np.rint(positions.reshape(n, 12*64).astype(np.float32) @ PIECE_SQUARE).astype(np.int32)
+    mg = pieceSquare[:, 0]
+    eg = pieceSquare[:, 1]
+    phase = np.minimum(positions.sum(axis=2, dtype=np.int32) @ PHASE_WEIGHT, chesseval.TOTAL_PHASE)
+
+    pawnMg, pawnEg = pawnTerms(positions)
+    mg += pawnMg
+    eg += pawnEg
+    score = (mg*phase + eg*(chesseval.TOTAL_PHASE - phase)) // chesseval.TOTAL_PHASE
+    if mobility:
+        score += mobilityTerm(positions)
+    return score
+
+'''
+Benchmark
+Random positions from random games, or the positions of a FEN file, scored one at a time
+by chessai.evaluate and as a batch.
+'''
+def randomPositions(count, seed=0):
+    rng = random.Random(seed)
+    states = []
+    while len(states) < count:
+        gs = chessengine.GameState()
+        for ply in range(rng.randint(0, 80)):
+            moves = gs.generateMoves()
+            if not moves:
+                break
+            gs.pushMove(rng.choice(moves))
+        states.append(chessengine.GameState.fromSnapshot(gs.getSnapshot()))
+    return states
+
+def loadPositions(path):
+    #GameStates of a file with one FEN per line, blank lines and # comments skipped
+    with open(path) as f:
+        return [chessengine.GameState.fromFen(line) for line in (line.strip() for line in f) if line and not line.startswith('#')]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Batch evaluation benchmark against chessai.evaluate')
+    parser.add_argument('-n', '--positions', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--fens', help='file of FEN positions to use instead of random ones')
+    args = parser.parse_args(argv)
+
+    if args.fens:
+        states = loadPositions(args.fens)
+        print('loaded %d positions' % len(states))
+    else:
+        print('generating %d positions' % args.positions)
+        states = randomPositions(args.positions, args.seed)
+
+    chessai.pawnTable.clear()
+    start = time.perf_counter()
+    scalar = [chessai.evaluate(gs) for gs in states]
+    scalarTime = time.perf_counter() - start
+
+    batch = np.empty((len(states), 64), dtype=np.int8)
+    start = time.perf_counter()
+    encodeSquares(states, batch)
+    encodeTime = time.perf_counter() - start
+    start = time.perf_counter()
+    scores = evaluateBatch(batch, mobility=False)
+    batchTime = time.perf_counter() - start
+    start = time.perf_counter()
+    evaluateBatch(batch)
+    mobilityTime = time.perf_counter() - start
+
+    n = len(states)
+    print('scalar            %8.3fs  %9d positions/s' % (scalarTime, n / scalarTime))
+    print('encode            %8.3fs  %9d positions/s' % (encodeTime, n / encodeTime))
+    print('batch             %8.3fs  %9d positions/s' % (batchTime, n / batchTime))
+    print('batch + mobility  %8.3fs  %9d positions/s' % (mobilityTime, n / mobilityTime))
+    mismatches = int((scores != np.array(scalar)).sum())
+    if mismatches:
+        print('FAILED: %d scores differ from chessai.evaluate' % mismatches)
+        return 1
+    print('All scores match')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+'''
+Bitboard tables used by the move generator in chessengine.
+A bitboard is a 64 bit integer with one bit per square. The square index is row*8 + col,
+the same layout as GameState.board, so bit 0 is a8 and bit 63 is h1.
+'''
+
+FULL = 0xFFFFFFFFFFFFFFFF
+WHITE = 0
+BLACK = 1
+
+#piece indices into GameState.pieceBB - white pieces 0-5, black pieces 6-11
+WP, WN, WB, WR, WQ, WK, BP, BN, BB, BR, BQ, BK = range(12)
+pieceNames = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+pieceIndex = {name: i for i, name in enumerate(pieceNames)}
+
+'''
+Square helpers
+'''
+def square(row, col):
+    return row*8 + col
+
+def lsb(bb):
+    #index of the lowest set bit, bb must not be 0
+    return (bb & -bb).bit_length() - 1
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+def squares(bb):
+    #all set bits as a list of square indices, lowest first
+    result = []
+    while bb:
+        low = bb & -bb
+        result.append(low.bit_length() - 1)
+        bb ^= low
+    return result
+
+def onBoard(row, col):
+    return 0 <= row < 8 and 0 <= col < 8
+
+#(row, col) of every square index, saves a divmod per generated move
+SQUARE_COORDS = [divmod(sq, 8) for sq in range(64)]
+
+'''
+Leaper tables - knight, king and pawn captures
+'''
+def _leaperTable(offsets):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        for dr, dc in offsets:
+            if onBoard(r+dr, c+dc):
+                bb |= 1 << square(r+dr, c+dc)
+        table.append(bb)
+    return table
+
+KNIGHT_ATTACKS = _leaperTable(((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2)))
+KING_ATTACKS = _leaperTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+#PAWN_ATTACKS[colour][sq] - squares a pawn of that colour on sq attacks. White moves up the board (row - 1)
+PAWN_ATTACKS = [_leaperTable(((-1, -1), (-1, 1))), _leaperTable(((1, -1), (1, 1)))]
+
+'''
+Sliding pieces
+RAYS[d][sq] holds every square from sq in direction d up to the edge of the board.
+The first four directions increase the square index, so the nearest blocker is the lowest bit,
+the last four decrease it, so the nearest blocker is the highest bit.
+'''
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1), #south, east, south east, south west
+              (-1, 0), (0, -1), (-1, -1), (-1, 1)) #north, west, north west, north east
+
+def _rayTable(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = divmod(sq, 8)
+        bb = 0
+        r, c = r+dr, c+dc
+        while onBoard(r, c):
+            bb |= 1 << square(r, c)
+            r, c = r+dr, c+dc
+        table.append(bb)
+    return table
+
+RAYS = [_rayTable(dr, dc) for dr, dc in DIRECTIONS]
+SOUTH, EAST, SOUTH_EAST, SOUTH_WEST, NORTH, WEST, NORTH_WEST, NORTH_EAST = RAYS
+
+def _slide(sq, occ, positive, negative):
+    attacks = 0
+    for ray in positive:
+        bb = ray[sq]
+        blockers = bb & occ
+        if blockers:
+            bb ^= ray[(blockers & -blockers).bit_length() - 1]
+        attacks |= bb
+    for ray in negative:
+        bb = ray[sq]
+        blockers = bb & occ
+        if blockers:
+            bb ^= ray[blockers.bit_length() - 1]
+        attacks |= bb
+    return attacks
+
+'''
+The sliding attack tables are indexed by the blockers on each line of the square.
+Each line (rank, file, diagonal, anti-diagonal) has at most 2^6 relevant blocker sets,
+so the tables stay small and a lookup is a mask plus a dict access per line.
+'''
+def _lineTable(positive, negative):
+    masks = []
+    tables = []
+    for sq in range(64):
+        #edge squares never change the attack set, so they are left out of the mask
+        full = positive[sq] | negative[sq]
+        mask = 0
+        for ray in (positive, negative):
+            bb = ray[sq]
+            if bb:
+                edge = bb & -bb if ray is negative else 1 << (bb.bit_length() - 1)
+                mask |= bb ^ edge
+        table = {}
+        subset = 0
+        while True: #walk every subset of the mask
+            table[subset] = _slide(sq, subset, (positive,), (negative,)) & full
+            subset = (subset - mask) & mask
+            if subset == 0:
+                break
+        masks.append(mask)
+        tables.append(table)
+    return masks, tables
+
+FILE_MASKS, FILE_TABLES = _lineTable(SOUTH, NORTH)
+RANK_MASKS, RANK_TABLES = _lineTable(EAST, WEST)
+DIAG_MASKS, DIAG_TABLES = _lineTable(SOUTH_EAST, NORTH_WEST)
+ANTI_MASKS, ANTI_TABLES = _lineTable(SOUTH_WEST, NORTH_EAST)
+
+def rookAttacks(sq, occ):
+    return FILE_TABLES[sq][occ & FILE_MASKS[sq]] | RANK_TABLES[sq][occ & RANK_MASKS[sq]]
+
+def bishopAttacks(sq, occ):
+    return DIAG_TABLES[sq][occ & DIAG_MASKS[sq]] | ANTI_TABLES[sq][occ & ANTI_MASKS[sq]]
+
+def queenAttacks(sq, occ):
+    return rookAttacks(sq, occ) | bishopAttacks(sq, occ)
+
+'''
+BETWEEN[a][b] - squares strictly between a and b when they share a line, else 0
+LINE[a][b] - the whole line through a and b when they share one, else 0. Used for pins
+'''
+BETWEEN = [[0]*64 for _ in range(64)]
+LINE = [[0]*64 for _ in range(64)]
+for _sq in range(64):
+    for _d in range(8):
+        _opposite = (_d + 4) % 8
+        _ray = RAYS[_d][_sq]
+        for _target in squares(_ray):
+            BETWEEN[_sq][_target] = _ray & RAYS[_opposite][_target]
+            LINE[_sq][_target] = _ray | RAYS[_opposite][_sq] | (1 << _sq)
+del _sq, _d, _opposite, _ray, _target
@@ -0,0 +1,99 @@
+'''
+Chess clock and time management.
+Clock keeps the time left of both sides and adds the increment after every move.
+allocateTime splits the time left into the limits of one move of the bot:
+
+soft - the search doesn't start another iteration once it is used up. chessai stretches it
+       while the best move keeps changing between iterations, an unsettled search gets more time.
+hard - the search stops there in the middle of an iteration, whatever it is doing.
+'''
+import time
+
+#the time picker of planning.txt - minutes per side
+TIME_CONTROLS = {
+    'Bullet': 1,
+    'Blitz I': 3,
+    'Blitz II': 5,
+    'Rapid I': 10,
+    'Rapid II': 30,
+    'Classical': 60,
+}
+#the per-move picker - seconds per move when there is no clock
+PER_MOVE_TIMES = (2, 5, 10, 30)
+
+class Clock():
+    def __init__(self, minutes, increment=0):
+        self.initial = minutes*60
+        self.increment = increment #seconds added after every move
+        self.reset()
+
+    def reset(self):
+        self.remaining = [self.initial, self.initial] #seconds, white then black, as of the last switch
+        self.running = None #0 while white's time runs, 1 for black, None when stopped
+        self.turnStart = 0
+
+    def timeLeft(self, white):
+        side = 0 if white else 1
+        left = self.remaining[side]
+        if self.running == side:
+            left -= time.time() - self.turnStart
+        return max(left, 0)
+
+    def start(self, white):
+        #runs the time of one side, the other stops - also used after an undo
+        self.stop()
+        self.running = 0 if white else 1
+        self.turnStart = time.time()
+
+    def stop(self):
+        if self.running is not None:
+            self.remaining[self.running] = self.timeLeft(self.running == 0)
+            self.running = None
+
+    def press(self, white):
+        #white (or black) has moved: its time stops and gets the increment, the opponent's runs
+        self.stop()
+        self.remaining[0 if white else 1] += self.increment
+        self.start(not white)
+
+    def flagged(self, white):
+        return self.timeLeft(white) <= 0
+
+def formatTime(seconds):
+    #m:ss, with tenths under ten seconds
+    if seconds < 10:
+        return '0:%04.1f' % seconds
+    seconds = int(seconds)
+    return '%d:%02d' % (seconds // 60, seconds % 60)
+
+'''
+Time management
+Without a moves-to-go count the game is assumed to last EXPECTED_MOVES moves, but never to
+end in fewer than MIN_MOVES_LEFT more, so the bot keeps a reserve in long games.
+The soft limit is the time left spread over those moves plus most of the increment. The hard
+limit lets an unstable search run a few times over, but never uses more than MAX_USAGE of
+what is left, so the bot can't lose on time however the search goes.
+'''
+EXPECTED_MOVES = 50
+MIN_MOVES_LEFT = 15
+INCREMENT_USAGE = 0.75 #part of the increment spent on every move
+HARD_FACTOR = 4 #hard limit in soft limits
+MAX_USAGE = 0.4 #of the time left, for one move
+MOVE_OVERHEAD = 0.05 #seconds lost per move between the search and the clock
+MIN_MOVE_TIME = 0.01 #seconds - even when about to flag the bot gets a deadline, never no limit
+
+def movesLeft(ply):
+    #the number of moves the side to move still expects to play
+    return max(MIN_MOVES_LEFT, EXPECTED_MOVES - ply // 2)
+
+def allocateTime(timeLeft, increment=0, movesToGo=None, ply=0):
+    '''
+    (soft, hard) seconds for the next move. timeLeft and increment are of the side to move,
+    movesToGo the moves to the next time control if there is one, ply the plies played so far.
+    '''
+    if movesToGo is None:
+        movesToGo = movesLeft(ply)
+    usable = max(timeLeft - MOVE_OVERHEAD, 0)
+    soft = usable / max(movesToGo, 1) + INCREMENT_USAGE*increment
+    hard = max(min(HARD_FACTOR*soft, MAX_USAGE*usable), MIN_MOVE_TIME)
+    return max(min(soft, hard), MIN_MOVE_TIME), hard
@@ -2,10 +2,181 @@
 Records current state of a chess game.
 It also determines all valid moves at the state and keeps a log.
 '''
+import random
+
+from chessbitboard import (WHITE, BLACK, FULL, SQUARE_COORDS, WP, WN, WB, WR, WQ, WK, BP, BN, BB, BR, BQ, BK, pieceNames, pieceIndex, lsb, popcount, squares,
+                           KNIGHT_ATTACKS, KING_ATTACKS, PAWN_ATTACKS, BETWEEN, LINE, rookAttacks, bishopAttacks)
+from chesseval import pieceSquare, phaseWeight
+
+EMPTY = -1 #mailbox value of an empty square
+
+'''
+Packed moves
+The search works on moves packed into a 16 bit int instead of Move objects:
+bits 0-5 are the start square, bits 6-11 the end square (square = row*8 + col, as in chessbitboard)
+and bits 12-15 a flag for the kind of move. The promotion flags carry the piece as well,
+flag & 3 is 0 knight, 1 bishop, 2 rook, 3 queen.
+Move objects are only built for the GUI and notation, by getValidMoves.
+'''
+QUIET = 0
+DOUBLE_PAWN_PUSH = 1
+KING_CASTLE = 2
+QUEEN_CASTLE = 3
+CAPTURE = 4
+EN_PASSANT = 5
+PROMOTION = 8 #8-11
+PROMOTION_CAPTURE = 12 #12-15
+promotionPieces = 'NBRQ'
+
+def encodeMove(start, end, flag):
+    return start | end << 6 | flag << 12
+
+def moveToUci(code):
+    #long algebraic notation of a packed move, e.g. e2e4 or e7e8q
+    start = SQUARE_COORDS[code & 63]
+    end = SQUARE_COORDS[code >> 6 & 63]
+    uci = Move.colsToFiles[start[1]] + Move.rowsToRanks[start[0]] + Move.colsToFiles[end[1]] + Move.rowsToRanks[end[0]]
+    if code >> 12 >= PROMOTION:
+        uci += promotionPieces[code >> 12 & 3].lower()
+    return uci
+
+def moveToSan(gs, code):
+    '''
+    Standard algebraic notation of a legal packed move in gs, as PGN writes it: Nbd7, exd6,
+    e8=Q+, O-O-O, Qxf7#. The file and/or rank of the start square is added when another
+    piece of the same kind can reach the end square too.
+    '''
+    start = code & 63
+    end = code >> 6 & 63
+    flag = code >> 12
+    if flag == KING_CASTLE:
+        san = 'O-O'
+    elif flag == QUEEN_CASTLE:
+        san = 'O-O-O'
+    else:
+        piece = gs.mailbox[start]
+        capture = flag == CAPTURE or flag == EN_PASSANT or flag >= PROMOTION_CAPTURE
+        endName = Move.colsToFiles[end & 7] + Move.rowsToRanks[end >> 3]
+        startFile = Move.colsToFiles[start & 7]
+        if piece == WP or piece == BP:
+            san = (startFile + 'x' if capture else '') + endName
+            if flag >= PROMOTION:
+                san += '=' + promotionPieces[flag & 3]
+        else:
+            san = pieceNames[piece][1]
+            rivals = [other & 63 for other in gs.generateMoves()
+                      if other >> 6 & 63 == end and other & 63 != start and gs.mailbox[other & 63] == piece]
+            if rivals:
+                if all(rival & 7 != start & 7 for rival in rivals):
+                    san += startFile
+                elif all(rival >> 3 != start >> 3 for rival in rivals):
+                    san += Move.rowsToRanks[start >> 3]
+                else:
+                    san += startFile + Move.rowsToRanks[start >> 3]
+            san += ('x' if capture else '') + endName
+    gs.pushMove(code)
+    replies = gs.generateMoves()
+    if gs.in_check:
+        san += '+' if replies else '#'
+    gs.popMove()
+    return san
+
+def sanToCode(gs, san):
+    '''
+    The legal packed move san stands for in gs, or None when there is none or it is ambiguous.
+    Check, mate and annotation marks are ignored, and so are 0-0 for O-O and a promotion
+    without the = (e8Q).
+    '''
+    san = san.rstrip('+#!?')
+    if san in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        flag = KING_CASTLE if len(san) == 3 else QUEEN_CASTLE
+        for code in gs.generateMoves():
+            if code >> 12 == flag:
+                return code
+        return None
+    promotion = None
+    if '=' in san:
+        san, promotion = san.split('=', 1)
+    elif len(san) > 2 and san[-1] in promotionPieces and san[-2] in '18':
+        san, promotion = san[:-1], san[-1]
+    if promotion is not None and (len(promotion) != 1 or promotion not in promotionPieces):
+        return None
+    letter = 'p'
+    if san[:1] in ('N', 'B', 'R', 'Q', 'K'):
+        letter, san = san[0], san[1:]
+    san = san.replace('x', '').replace('-', '') #captures aren't checked, nor long algebraic dashes
+    if len(san) < 2 or san[-2] not in Move.filesToCols or san[-1] not in Move.ranksToRows:
+        return None
+    end = Move.ranksToRows[san[-1]]*8 + Move.filesToCols[san[-2]]
+    fromCol = fromRow = None
+    for char in san[:-2]:
+        if char in Move.filesToCols:
+            fromCol = Move.filesToCols[char]
+        elif char in Move.ranksToRows:
+            fromRow = Move.ranksToRows[char]
+        else:
+            return None
+
+    found = None
+    for code in gs.generateMoves():
+        start = code & 63
+        flag = code >> 12
+        if code >> 6 & 63 != end or pieceNames[gs.mailbox[start]][1] != letter:
+            continue
+        if flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            continue
+        if (promotionPieces[flag & 3] if flag >= PROMOTION else None) != promotion:
+            continue
+        if (fromCol is not None and start & 7 != fromCol) or (fromRow is not None and start >> 3 != fromRow):
+            continue
+        if found is not None:
+            return None
+        found = code
+    return found
+
+'''
+Castling rights are the bits of one int. castlingMask[sq] is what survives a move from or to sq,
+so moving a king or rook, or capturing a rook at home, clears the right in one AND.
+'''
+WKS, WQS, BKS, BQS = 1, 2, 4, 8
+castlingMask = [15]*64
+castlingMask[56] = 15 ^ WQS #a1
+castlingMask[63] = 15 ^ WKS #h1
+castlingMask[60] = 15 ^ WKS ^ WQS #e1
+castlingMask[0] = 15 ^ BQS #a8
+castlingMask[7] = 15 ^ BKS #h8
+castlingMask[4] = 15 ^ BKS ^ BQS #e8
+#FEN letter -> the right, and the (row, col) and piece of the king and the rook it needs at home
+FEN_CASTLING = {'K': (WKS, (7, 4), (7, 7), 'wK', 'wR'), 'Q': (WQS, (7, 4), (7, 0), 'wK', 'wR'),
+                'k': (BKS, (0, 4), (0, 7), 'bK', 'bR'), 'q': (BQS, (0, 4), (0, 0), 'bK', 'bR')}
+
+'''
+Zobrist keys
+A position key is the XOR of a random 64 bit number for every (piece, square) on the board,
+plus one for black to move, one per castling right and one for the en passant file.
+Making a move only XORs in and out what changed, so the key costs a few operations per move.
+The generator is seeded so keys are the same every run.
+'''
+_zobristRandom = random.Random(0x5EED)
+zobristPieces = [[_zobristRandom.getrandbits(64) for sq in range(64)] for piece in range(12)]
+zobristBlackToMove = _zobristRandom.getrandbits(64)
+_zobristRights = [_zobristRandom.getrandbits(64) for right in range(4)] #wks, wqs, bks, bqs
+zobristEnPassant = [_zobristRandom.getrandbits(64) for col in range(8)]
+#key of every combination of castling rights
+zobristCastling = [0]*16
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights >> _bit & 1:
+            zobristCastling[_rights] ^= _zobristRights[_bit]
+
+#a8 is a light square
+LIGHT_SQUARES = sum(1 << sq for sq in range(64) if ((sq >> 3) + (sq & 7)) % 2 == 0)
+
+STARTING_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
 
 class GameState:
-    #what happens at the start - initialize
-    def __init__(self):
+    #what happens at the start - initialize. With fen the game starts from that position instead
+    def __init__(self, fen=None):
         #board is an 8x8 2d list, each element represents a piece or an empty square
         #first char represents color (b/w) and second char represents the piece-type
         self.board = [
@@ -19,607 +190,680 @@ class GameState:
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
         ]
 
-        self.moveFunctions = {
-            'p': self.getPawnMoves, 
-            'R': self.getRookMoves, 
-            'N': self.getKnightMoves, 
-            'B': self.getBishopMoves,
-            'Q': self.getQueenMoves, 
-            'K': self.getKingMoves,
-        }
         self.whiteToMove = True #white starts the game
         self.moveLog = []
         self.whiteKing = (7,4)
         self.blackKing = (0,4)
         self.in_check = False
-        self.pins = []
-        self.checks = []
         self.checkmate = False
         self.stalemate = False
-        self.enPassantPossible = () #coordinate (r,c) where an enpassant is possible
+        self.drawReason = None #'threefold repetition', 'fifty-move rule' or 'insufficient material' once the game is drawn
+        self.epSquare = -1 #square index where an enpassant capture is possible, -1 for none
 
         #not to check is castling is possible, but to check if castling rules are broken
         #for example, rook and king are not in original positions
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.wqs, self.currentCastlingRight.bks, self.currentCastlingRight.bqs)]
-        #can be updated as moves are played. In comparison to just keeping it equal to current Castling Right which is constant
-    
+        self.castling = WKS | WQS | BKS | BQS
+        self.halfmoveClock = 0 #plies since the last capture or pawn move, for the fifty-move rule
+        self.fullmoveNumber = 1 #goes up after every black move
+
+        #undo stack - one packed int per made move: the move, the captured piece, and the castling rights,
+        #en passant square and halfmove clock from before it. The Zobrist keys before each move go to keyHistory,
+        #the evaluation sums and pawn key are worked back by popMove. keyCounts counts how often every
+        #position key has been on the board, for repetitions
+        self.undoStack = []
+        self.keyHistory = []
+
+        if fen is not None:
+            self.parseFen(fen)
+        self.initBitboards()
+        if fen is not None:
+            them = BLACK if self.whiteToMove else WHITE
+            if self.isSquareAttacked(lsb(self.pieceBB[6*them + 5]), them ^ 1):
+                raise ValueError('FEN side not to move is in check: ' + fen)
+
     '''
-    Update Castle Rights
+    The en passant square and castling rights are stored as ints, these give the
+    (row, col) and CastleRights forms the rest of the code was written against
     '''
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False    
-
-        if move.pieceMoved == 'wR': #white rooks
-            if move.startRow == 7:
-                #col 0 - queen, col 7 - king
-                if move.startCol == 0:
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRight.wks = False
-            
-        elif move.pieceMoved == 'bR': #black rooks
-            if move.startRow == 0:
-                #col 0 - queen, col 7 - king
-                if move.startCol == 0:
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:
-                    self.currentCastlingRight.bks = False
-
-        # else the rook is not in the original position so we don't do anything
+    @property
+    def enPassantPossible(self):
+        return SQUARE_COORDS[self.epSquare] if self.epSquare >= 0 else ()
+
+    @enPassantPossible.setter
+    def enPassantPossible(self, square):
+        self.epSquare = square[0]*8 + square[1] if square != () else -1
+
+    @property
+    def currentCastlingRight(self):
+        return CastleRights(bool(self.castling & WKS), bool(self.castling & WQS), bool(self.castling & BKS), bool(self.castling & BQS))
+
+    @currentCastlingRight.setter
+    def currentCastlingRight(self, rights):
+        self.castling = (WKS if rights.wks else 0) | (WQS if rights.wqs else 0) | (BKS if rights.bks else 0) | (BQS if rights.bqs else 0)
+
+    '''
+    Bitboards
+    pieceBB holds one 64 bit integer per piece type and colour (see chessbitboard.pieceNames),
+    colourBB holds every white and every black piece and mailbox the piece index on every square.
+    All of them are kept in step with self.board, which stays the list of strings the GUI draws from.
+    psqScore is the packed material and piece-square score and phase the game phase (see chesseval),
+    both kept up to date by every move as well, and so is pawnKey - the Zobrist key of the pawns alone,
+    which the pawn structure evaluation is cached under.
+    '''
+    def initBitboards(self):
+        #rebuilds everything derived from the board - bitboards, mailbox, evaluation sums and the Zobrist key
+        self.pieceBB = [0]*12
+        self.colourBB = [0, 0]
+        self.mailbox = [EMPTY]*64
+        self.psqScore = 0
+        self.phase = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != '--':
+                    bit = 1 << (r*8 + c)
+                    index = pieceIndex[piece]
+                    self.pieceBB[index] |= bit
+                    self.colourBB[WHITE if piece[0] == 'w' else BLACK] |= bit
+                    self.mailbox[r*8 + c] = index
+                    self.psqScore += pieceSquare[index][r*8 + c]
+                    self.phase += phaseWeight[index]
+        self.zobristKey = self.computeZobristKey()
+        self.pawnKey = self.computePawnKey()
+        self.keyCounts = {self.zobristKey: 1}
+
+    def computeZobristKey(self):
+        #full key from scratch, pushMove keeps it up to date incrementally
+        key = 0
+        for piece in range(12):
+            for sq in squares(self.pieceBB[piece]):
+                key ^= zobristPieces[piece][sq]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        return key ^ zobristCastling[self.castling] ^ self.enPassantKey()
+
+    def computePawnKey(self):
+        key = 0
+        for piece in (WP, BP):
+            for sq in squares(self.pieceBB[piece]):
+                key ^= zobristPieces[piece][sq]
+        return key
+
+    def enPassantKey(self):
+        #the en passant file only changes the position when a pawn of the side to move can take there
+        if self.epSquare < 0:
+            return 0
+        us = WHITE if self.whiteToMove else BLACK
+        if PAWN_ATTACKS[us ^ 1][self.epSquare] & self.pieceBB[6*us]:
+            return zobristEnPassant[self.epSquare & 7]
+        return 0
+
+    '''
+    FEN
+    Forsyth-Edwards Notation - the board rank 8 first, side to move, castling rights,
+    en passant square, halfmove clock and fullmove number. GameState(fen) and fromFen set the
+    position up from the string directly, the bitboards and keys are built once from it.
+    '''
+    @classmethod
+    def fromFen(cls, fen):
+        return cls(fen)
+
+    def parseFen(self, fen):
+        #fills in the board and the state fields from fen, initBitboards has to follow
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError('FEN needs at least 4 fields: ' + fen)
+        ranks = fields[0].split('/')
+        if len(ranks) != 8:
+            raise ValueError('FEN board needs 8 ranks: ' + fen)
+        board = []
+        for r, rank in enumerate(ranks):
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(['--']*int(char))
+                elif char.lower() in 'pnbrqk':
+                    piece = ('w' if char.isupper() else 'b') + (char.upper() if char.lower() != 'p' else 'p')
+                    if piece == 'wK':
+                        self.whiteKing = (r, len(row))
+                    elif piece == 'bK':
+                        self.blackKing = (r, len(row))
+                    row.append(piece)
+                else:
+                    raise ValueError('bad FEN piece ' + char + ': ' + fen)
+            if len(row) != 8:
+                raise ValueError('FEN rank ' + rank + ' is not 8 squares: ' + fen)
+            board.append(row)
+        if sum(row.count('wK') for row in board) != 1 or sum(row.count('bK') for row in board) != 1:
+            raise ValueError('FEN needs one king of each colour: ' + fen)
+        if 'wp' in board[0] or 'wp' in board[7] or 'bp' in board[0] or 'bp' in board[7]:
+            raise ValueError('FEN has a pawn on the first or last rank: ' + fen)
+        if fields[1] not in ('w', 'b'):
+            raise ValueError('bad FEN side to move ' + fields[1] + ': ' + fen)
+        self.board = board
+        self.whiteToMove = fields[1] == 'w'
+        self.castling = 0
+        if fields[2] != '-':
+            for char in fields[2]:
+                if char not in FEN_CASTLING:
+                    raise ValueError('bad FEN castling rights ' + fields[2] + ': ' + fen)
+                right, kingSquare, rookSquare, king, rook = FEN_CASTLING[char]
+                #a right is only kept while the king and that rook have never moved
+                if board[kingSquare[0]][kingSquare[1]] != king or board[rookSquare[0]][rookSquare[1]] != rook:
+                    raise ValueError('FEN castling right ' + char + ' without the king and rook at home: ' + fen)
+                self.castling |= right
+        self.epSquare = -1
+        if fields[3] != '-':
+            enPassant = fields[3]
+            if len(enPassant) != 2 or enPassant[0] not in Move.filesToCols or enPassant[1] != ('6' if self.whiteToMove else '3'):
+                raise ValueError('bad FEN en passant square ' + enPassant + ': ' + fen)
+            row, col = Move.ranksToRows[enPassant[1]], Move.filesToCols[enPassant[0]]
+            #the pawn that just moved two squares stands in front of it
+            pushed = 1 if self.whiteToMove else -1
+            if board[row + pushed][col] != ('bp' if self.whiteToMove else 'wp'):
+                raise ValueError('FEN en passant square ' + enPassant + ' without the pawn that passed it: ' + fen)
+            self.epSquare = row*8 + col
+        self.halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        self.fullmoveNumber = int(fields[5]) if len(fields) > 5 else 1
+
+    def getFen(self):
+        ranks = []
+        for row in self.board:
+            rank = ''
+            empty = 0
+            for piece in row:
+                if piece == '--':
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += piece[1].upper() if piece[0] == 'w' else piece[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castling = ''.join(char for char, right in (('K', WKS), ('Q', WQS), ('k', BKS), ('q', BQS)) if self.castling & right)
+        if self.epSquare >= 0:
+            row, col = SQUARE_COORDS[self.epSquare]
+            enPassant = Move.colsToFiles[col] + Move.rowsToRanks[row]
+        else:
+            enPassant = '-'
+        return ' '.join(['/'.join(ranks), 'w' if self.whiteToMove else 'b', castling or '-', enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)])
+
+    '''
+    Snapshot
+    A small picklable tuple holding the whole position - the piece bitboards, side to move,
+    castling rights, en passant square and the two move counters, and the keys of the positions
+    since the last capture or pawn move (the only ones that can come back, for repetitions).
+    It is what gets sent to other processes.
+    '''
+    def getSnapshot(self):
+        reversible = tuple(self.keyHistory[max(len(self.keyHistory) - self.halfmoveClock, 0):])
+        return (tuple(self.pieceBB), self.whiteToMove, self.castling, self.epSquare, self.halfmoveClock, self.fullmoveNumber, reversible)
+
+    @classmethod
+    def fromSnapshot(cls, snapshot):
+        gs = cls()
+        pieceBB, gs.whiteToMove, gs.castling, gs.epSquare, gs.halfmoveClock, gs.fullmoveNumber, reversible = snapshot
+        gs.board = [['--']*8 for _ in range(8)]
+        for piece in range(12):
+            for sq in squares(pieceBB[piece]):
+                gs.board[sq >> 3][sq & 7] = pieceNames[piece]
+        gs.whiteKing = SQUARE_COORDS[lsb(pieceBB[WK])]
+        gs.blackKing = SQUARE_COORDS[lsb(pieceBB[BK])]
+        gs.initBitboards()
+        gs.keyHistory = list(reversible) #so a snapshot of this position has them too
+        for key in reversible:
+            gs.keyCounts[key] = gs.keyCounts.get(key, 0) + 1
+        return gs
+
+    def setSquare(self, r, c, piece):
+        #puts piece (or '--' to empty it) on r, c and updates the bitboards to match
+        sq = r*8 + c
+        bit = 1 << sq
+        old = self.mailbox[sq]
+        if old != EMPTY:
+            self.pieceBB[old] ^= bit
+            self.colourBB[WHITE if old < 6 else BLACK] ^= bit
+            self.zobristKey ^= zobristPieces[old][sq]
+            self.psqScore -= pieceSquare[old][sq]
+            self.phase -= phaseWeight[old]
+            if old == WP or old == BP:
+                self.pawnKey ^= zobristPieces[old][sq]
+            self.mailbox[sq] = EMPTY
+        if piece != '--':
+            index = pieceIndex[piece]
+            self.pieceBB[index] |= bit
+            self.colourBB[WHITE if index < 6 else BLACK] |= bit
+            self.zobristKey ^= zobristPieces[index][sq]
+            self.psqScore += pieceSquare[index][sq]
+            self.phase += phaseWeight[index]
+            if index == WP or index == BP:
+                self.pawnKey ^= zobristPieces[index][sq]
+            self.mailbox[sq] = index
+        self.board[r][c] = piece
 
     '''
     Making Moves
+    makeMove and undoMove are for Move objects from getValidMoves and keep the moveLog.
+    Both go through pushMove and popMove, which the search calls directly with packed moves.
     '''
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = '--' #the starting square is emptied
-        self.board[move.endRow][move.endCol] = move.pieceMoved #the end square is displaced with the piece
+        if move.isPawnPromotion and move.promotionPiece == '': #getValidMoves always sets the piece, a move built by hand becomes a queen
+            move.promotionPiece = 'Q'
+        self.pushMove(move.getCode())
         self.moveLog.append(move) #append move in notation
-        self.whiteToMove = not self.whiteToMove #switch turns
-
-        if move.pieceMoved == 'wK':
-            self.whiteKing = (move.endRow, move.endCol)
-        if move.pieceMoved == 'bK':
-            self.blackKing = (move.endRow, move.endCol)
-
-        if move.isPawnPromotion:
-            promotionPiece = str(input("Choose a piece to promote to: 'Q', 'R', 'B' or 'N'")).upper()
-            move.promotionPiece += promotionPiece
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionPiece
-
-        #enpassant capturing
-        if move.isEnPassantMove == True:
-            # print('enpassant')
-            # print(self.board[move.startRow][move.endCol])
-            self.board[move.startRow][move.endCol] = '--'
-            
-        #update enpassantpossible variable
-        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2: #absolute vsalue, black and white applies
-            #double divide is integer division - black to move, 7+5/2 = row 6. White? 2+4/2 = row 3.
-            self.enPassantPossible = ((move.startRow+move.endRow)//2, move.startCol)
-            # print(self.enPassantPossible)
-        else:
-            self.enPassantPossible = ()
-
-        #updating castling rights
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.wqs, self.currentCastlingRight.bks, self.currentCastlingRight.bqs))
-       
-        #castleMove
-        if move.isCastleMove:
-            if move.endCol - move.startCol == 2: 
-                #moved to the right by 2 squares, indicating kingside castle
-                #king is already moved in the getKingMoves function, this is just to move the rook
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] 
-                #moves rook to the left of the king
-                self.board[move.endRow][move.endCol+1] = '--' #empty original rook square
-            else:
-                #a queenside castle
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol-2] 
-                self.board[move.endRow][move.endCol-2] = '--' #empty original rook square
 
     #UNDO move
     
     def undoMove(self):
         if len(self.moveLog) != 0:
-            move = self.moveLog.pop() #removes last move from log
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured #if its is empty it will return '--'
-            self.whiteToMove = not self.whiteToMove #switch turns
-            if move.pieceMoved == 'wK':
-                self.whiteKing = (move.startRow, move.startCol)
-            if move.pieceMoved == 'bK':
-                self.blackKing = (move.startRow, move.startCol)
-            
-            if move.isEnPassantMove:
-                self.board[move.endRow][move.endCol] = "--"  # leave landing square blank
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enPassantPossible = (move.endRow, move.endCol)
-            
-            if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-                self.enPassantPossible = ()
-                
-            #undo castling rights
-            self.castleRightsLog.pop() #get rid of new castle rights from undid move
-            self.currentCastlingRight = self.castleRightsLog[-1] #set current castle rights to the latest one pre-undo       
-            
-            #undo Castle Move
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2:
-                    #kingside:
-                    self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-1]
-                    #put the rook back
-                    self.board[move.endRow][move.endCol-1] = '--'
-                else:
-                    self.board[move.endRow][move.endCol-2] = self.board[move.endRow][move.endCol+1]
-                    #put the rook back
-                    self.board[move.endRow][move.endCol+1] = '--'
-
+            self.moveLog.pop() #removes last move from log
+            self.popMove()
         self.checkmate = False
         self.stalemate = False
+        self.drawReason = None
+
+    def pushMove(self, code):
+        '''
+        Makes a packed move. Everything is updated in place: the only thing stored is
+        one int on the undo stack and the old key, so popMove can take the move back.
+        '''
+        start = code & 63
+        end = code >> 6 & 63
+        flag = code >> 12
+        mailbox = self.mailbox
+        pieceBB = self.pieceBB
+        colourBB = self.colourBB
+        board = self.board
+        zobrist = zobristPieces
+        us = WHITE if self.whiteToMove else BLACK
+        piece = mailbox[start]
+        captured = mailbox[end]
+
+        self.undoStack.append(code | (captured + 1) << 16 | self.castling << 20 | (self.epSquare + 1) << 24 | self.halfmoveClock << 31)
+        key = self.zobristKey
+        self.keyHistory.append(key)
+        #take the old castling rights, en passant file and side to move out of the key, the new ones go back at the end
+        key ^= zobristBlackToMove ^ zobristCastling[self.castling] ^ self.enPassantKey()
+        score = self.psqScore
+        pawnKey = self.pawnKey
+
+        endBit = 1 << end
+        if captured != EMPTY:
+            pieceBB[captured] ^= endBit
+            colourBB[us ^ 1] ^= endBit
+            key ^= zobrist[captured][end]
+            score -= pieceSquare[captured][end]
+            self.phase -= phaseWeight[captured]
+            if captured == WP or captured == BP:
+                pawnKey ^= zobrist[captured][end]
+        moveBits = 1 << start | endBit
+        pieceBB[piece] ^= moveBits
+        colourBB[us] ^= moveBits
+        key ^= zobrist[piece][start] ^ zobrist[piece][end]
+        score += pieceSquare[piece][end] - pieceSquare[piece][start]
+        if piece == WP or piece == BP:
+            pawnKey ^= zobrist[piece][start] ^ zobrist[piece][end]
+        mailbox[start] = EMPTY
+        mailbox[end] = piece
+        board[start >> 3][start & 7] = '--'
+        board[end >> 3][end & 7] = pieceNames[piece]
+
+        if flag >= PROMOTION:
+            promoted = piece + (flag & 3) + 1 #pawn index + 1-4 is the knight-queen of the same colour
+            pieceBB[piece] ^= endBit
+            pieceBB[promoted] |= endBit
+            key ^= zobrist[piece][end] ^ zobrist[promoted][end]
+            score += pieceSquare[promoted][end] - pieceSquare[piece][end]
+            pawnKey ^= zobrist[piece][end]
+            self.phase += phaseWeight[promoted]
+            mailbox[end] = promoted
+            board[end >> 3][end & 7] = pieceNames[promoted]
+        elif flag == EN_PASSANT:
+            #the captured pawn is behind the end square
+            capturedSq = end + 8 if us == WHITE else end - 8
+            enemyPawn = BP if us == WHITE else WP
+            bit = 1 << capturedSq
+            pieceBB[enemyPawn] ^= bit
+            colourBB[us ^ 1] ^= bit
+            key ^= zobrist[enemyPawn][capturedSq]
+            score -= pieceSquare[enemyPawn][capturedSq]
+            pawnKey ^= zobrist[enemyPawn][capturedSq]
+            mailbox[capturedSq] = EMPTY
+            board[capturedSq >> 3][capturedSq & 7] = '--'
+        elif flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            #the king has moved two squares, bring the rook to the other side of it
+            if flag == KING_CASTLE:
+                rookStart, rookEnd = end + 1, end - 1
+            else:
+                rookStart, rookEnd = end - 2, end + 1
+            rook = piece - 2 #king index - 2 is the rook of the same colour
+            rookBits = 1 << rookStart | 1 << rookEnd
+            pieceBB[rook] ^= rookBits
+            colourBB[us] ^= rookBits
+            key ^= zobrist[rook][rookStart] ^ zobrist[rook][rookEnd]
+            score += pieceSquare[rook][rookEnd] - pieceSquare[rook][rookStart]
+            mailbox[rookStart] = EMPTY
+            mailbox[rookEnd] = rook
+            board[rookStart >> 3][rookStart & 7] = '--'
+            board[rookEnd >> 3][rookEnd & 7] = pieceNames[rook]
+
+        if piece == WK:
+            self.whiteKing = SQUARE_COORDS[end]
+        elif piece == BK:
+            self.blackKing = SQUARE_COORDS[end]
+        self.castling &= castlingMask[start] & castlingMask[end]
+        #the square the pawn skipped over
+        self.epSquare = (start + end) >> 1 if flag == DOUBLE_PAWN_PUSH else -1
+        if piece == WP or piece == BP or captured != EMPTY:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if us == BLACK:
+            self.fullmoveNumber += 1
+        self.whiteToMove = not self.whiteToMove #switch turns
+        key ^= zobristCastling[self.castling] ^ self.enPassantKey()
+        self.zobristKey = key
+        self.keyCounts[key] = self.keyCounts.get(key, 0) + 1
+        self.psqScore = score
+        self.pawnKey = pawnKey
+
+    def popMove(self):
+        #takes back the last pushMove
+        record = self.undoStack.pop()
+        start = record & 63
+        end = record >> 6 & 63
+        flag = record >> 12 & 15
+        captured = (record >> 16 & 15) - 1
+        self.castling = record >> 20 & 15
+        self.epSquare = (record >> 24 & 127) - 1
+        self.halfmoveClock = record >> 31
+        keyCounts = self.keyCounts
+        count = keyCounts[self.zobristKey] - 1
+        if count:
+            keyCounts[self.zobristKey] = count
+        else:
+            del keyCounts[self.zobristKey]
+        self.zobristKey = self.keyHistory.pop()
+        self.whiteToMove = not self.whiteToMove #switch turns
+        mailbox = self.mailbox
+        pieceBB = self.pieceBB
+        colourBB = self.colourBB
+        board = self.board
+        zobrist = zobristPieces
+        us = WHITE if self.whiteToMove else BLACK
+        if us == BLACK:
+            self.fullmoveNumber -= 1
+        #the evaluation sums and pawn key are worked back by the same steps as pushMove, in reverse
+        score = self.psqScore
+        pawnKey = self.pawnKey
+
+        piece = mailbox[end]
+        endBit = 1 << end
+        if flag >= PROMOTION: #turn the promoted piece back into a pawn
+            pieceBB[piece] ^= endBit
+            score -= pieceSquare[piece][end]
+            self.phase -= phaseWeight[piece]
+            piece = WP if us == WHITE else BP
+            pieceBB[piece] |= endBit
+            score += pieceSquare[piece][end]
+            pawnKey ^= zobrist[piece][end]
+        score += pieceSquare[piece][start] - pieceSquare[piece][end]
+        if piece == WP or piece == BP:
+            pawnKey ^= zobrist[piece][start] ^ zobrist[piece][end]
+        moveBits = 1 << start | endBit
+        pieceBB[piece] ^= moveBits
+        colourBB[us] ^= moveBits
+        mailbox[start] = piece
+        mailbox[end] = captured
+        board[start >> 3][start & 7] = pieceNames[piece]
+        if captured != EMPTY:
+            pieceBB[captured] |= endBit
+            colourBB[us ^ 1] |= endBit
+            board[end >> 3][end & 7] = pieceNames[captured]
+            score += pieceSquare[captured][end]
+            self.phase += phaseWeight[captured]
+            if captured == WP or captured == BP:
+                pawnKey ^= zobrist[captured][end]
+        else:
+            board[end >> 3][end & 7] = '--'
+
+        if flag == EN_PASSANT:
+            capturedSq = end + 8 if us == WHITE else end - 8
+            enemyPawn = BP if us == WHITE else WP
+            bit = 1 << capturedSq
+            pieceBB[enemyPawn] |= bit
+            colourBB[us ^ 1] |= bit
+            mailbox[capturedSq] = enemyPawn
+            board[capturedSq >> 3][capturedSq & 7] = pieceNames[enemyPawn]
+            score += pieceSquare[enemyPawn][capturedSq]
+            pawnKey ^= zobrist[enemyPawn][capturedSq]
+        elif flag == KING_CASTLE or flag == QUEEN_CASTLE:
+            if flag == KING_CASTLE:
+                rookStart, rookEnd = end + 1, end - 1
+            else:
+                rookStart, rookEnd = end - 2, end + 1
+            rook = piece - 2
+            rookBits = 1 << rookStart | 1 << rookEnd
+            pieceBB[rook] ^= rookBits
+            colourBB[us] ^= rookBits
+            mailbox[rookEnd] = EMPTY
+            mailbox[rookStart] = rook
+            board[rookEnd >> 3][rookEnd & 7] = '--'
+            board[rookStart >> 3][rookStart & 7] = pieceNames[rook]
+            score += pieceSquare[rook][rookStart] - pieceSquare[rook][rookEnd]
+
+        if piece == WK:
+            self.whiteKing = SQUARE_COORDS[start]
+        elif piece == BK:
+            self.blackKing = SQUARE_COORDS[start]
+        self.psqScore = score
+        self.pawnKey = pawnKey
 
     '''
     All moves considering checks
+    getValidMoves gives Move objects for the GUI, four per promotion square - one for each piece,
+    carried by the move. generateMoves gives the packed moves the search uses.
     '''
     def getValidMoves(self):
-        tempEnPassantPossible = self.enPassantPossible
-        tempCastleRights = CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks, self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)        
-        
         moves = []
-        self.in_check, self.pins, self.checks = self.checkForPinsAndChecks()
-
-        if self.whiteToMove:
-            king_row = self.whiteKing[0]
-            king_col = self.whiteKing[1]
-        else:
-            king_row = self.blackKing[0]
-            king_col = self.blackKing[1]
-
-        if self.in_check:
-            if len(self.checks) == 1:  # only 1 check, block the check or move the king
-                moves = self.getPossibleMoves()
-                # to block the check you must put a piece into one of the squares between the enemy piece and your king
-                check = self.checks[0]  # check information
-                #endRow, endCol, [of the checker piece] row direction, column direction
-                check_row = check[0]
-                check_col = check[1]
-
-                #square - row, col of the chekcing piece
-                piece_checking = self.board[check_row][check_col]
-                valid_squares = []  # squares that pieces can move to
-
-                # if knight, must capture the knight or move your king, other pieces can be blocked
-                if piece_checking[1] == "N":
-                    valid_squares = [(check_row, check_col)]
-                else:
-                    for i in range(1, 8):
-                        valid_square = (king_row + check[2] * i,
-                                        king_col + check[3] * i)  # check[2] and check[3] are the check directions
-                        valid_squares.append(valid_square)
-                        if valid_square[0] == check_row and valid_square[1] == check_col:  # once you get to the checking pieces'srow/col
-                            break
-
-                # get rid of any moves that don't block check or move king
-                #STILL IN THE INCHECK CONDITIONAL
-                for i in range(len(moves) - 1, -1, -1):  # iterate through the list backwards when removing elements
-                    if moves[i].pieceMoved[1] != "K":  # move doesn't move king so it must block or capture
-                        if not (moves[i].endRow, moves[i].endCol) in valid_squares:  # move doesn't block or capture piece
-                            moves.remove(moves[i])
-
-            else:  # double check, king has to move
-                self.getKingMoves(king_row, king_col, moves)
-
-        else:  # not in check - all moves are fine
-            moves = self.getPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKing[0], self.whiteKing[1], moves)
-        else:
-            self.getCastleMoves(self.blackKing[0], self.blackKing[1], moves)
-        
-        if len(self.moveLog) >= 6: #shortest possible repetition is 6 moves
-            if (self.moveLog[-1] == self.moveLog[-3] == self.moveLog[-5]) and (self.moveLog[-2] == self.moveLog[-4] == self.moveLog[-6]):
-                self.stalemate == True
-                #draw (stalemate) on third repetition based off movelog
-
+        board = self.board
+        coords = SQUARE_COORDS
+        for code in self.generateMoves():
+            flag = code >> 12
+            moves.append(Move(coords[code & 63], coords[code >> 6 & 63], board,
+                              isEnPassantMove=flag == EN_PASSANT, isCastleMove=flag == KING_CASTLE or flag == QUEEN_CASTLE,
+                              promotionPiece=promotionPieces[flag & 3] if flag >= PROMOTION else ''))
+
+        self.drawReason = None
         if len(moves) == 0:
-            if self.inCheck():
+            if self.in_check:
                 self.checkmate = True
             else:
                 self.stalemate = True
         else:
             self.checkmate = False
             self.stalemate = False
-        
-        self.enPassantPossible = tempEnPassantPossible
-        self.currentCastlingRight = tempCastleRights
+            if self.repetitionCount() >= 3:
+                self.drawReason = 'threefold repetition'
+            elif self.halfmoveClock >= 100:
+                self.drawReason = 'fifty-move rule'
+            elif self.isInsufficientMaterial():
+                self.drawReason = 'insufficient material'
 
         return moves
 
-    '''----------------------------------------------------------------'''
-
-    def checkForPinsAndChecks(self):
-        pins = []  # squares pinned and the direction its pinned from
-        checks = []  # squares where enemy is applying a check
-        in_check = False
-        if self.whiteToMove:
-            enemy_color = "b"
-            ally_color = "w"
-            start_row = self.whiteKing[0]
-            start_col = self.whiteKing[1]
-        else:
-            enemy_color = "w"
-            ally_color = "b"
-            start_row = self.blackKing[0]
-            start_col = self.blackKing[1]
-        # check outwards from king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            direction = directions[j]
-            possible_pin = ()  # reset possible pins
-            for i in range(1, 8):
-                endRow = start_row + direction[0] * i
-                endCol = start_col + direction[1] * i
-                if 0 <= endRow <= 7 and 0 <= endCol <= 7:
-                    end_piece = self.board[endRow][endCol]
-                    if end_piece[0] == ally_color and end_piece[1] != "K":
-                        if possible_pin == ():  # first allied piece could be pinned
-                            possible_pin = (endRow, endCol, direction[0], direction[1])
-                            # print(possible_pin)
-                        else:  # 2nd allied piece - no check or pin from this direction
-                            break
-                    elif end_piece[0] == enemy_color:
-                        enemy_type = end_piece[1]
-                        # 5 possibilities in this complex conditional
-                        # 1.) orthogonally away from king and piece is a rook
-                        # 2.) diagonally away from king and piece is a bishop
-                        # 3.) 1 square away diagonally from king and piece is a pawn
-                        # 4.) any direction and piece is a queen
-                        # 5.) any direction 1 square away and piece is a king
-                        if (0 <= j <= 3 and enemy_type == "R") or (4 <= j <= 7 and enemy_type == "B") or (i == 1 and enemy_type == "p" and ((enemy_color == "w" and 6 <= j <= 7) or (enemy_color == "b" and 4 <= j <= 5))) or (enemy_type == "Q") or (i == 1 and enemy_type == "K"):
-                            if possible_pin == ():  # no piece blocking, so check
-                                in_check = True
-                                checks.append((endRow, endCol, direction[0], direction[1]))
-                                break
-                            else:  # piece blocking so pin
-                                pins.append(possible_pin)
-                                break
-                        else:  # enemy piece not applying checks, or empty square
-                            break
-                else:
-                    break  # off board
-        # check for knight checks
-        knight_moves = ((-2, -1), (-2, 1), (-1, 2), (1, 2), (2, -1), (2, 1), (-1, -2), (1, -2))
-        for move in knight_moves:
-            endRow = start_row + move[0]
-            endCol = start_col + move[1]
-            if 0 <= endRow <= 7 and 0 <= endCol <= 7:
-                end_piece = self.board[endRow][endCol]
-                if end_piece[0] == enemy_color and end_piece[1] == "N":  # enemy knight attacking a king
-                    in_check = True
-                    checks.append((endRow, endCol, move[0], move[1]))
-        return in_check, pins, checks
-    
-    '''----------------------------------------------------------------'''
-
-    '''Determine if the player is in check, r,c'''
-    def inCheck(self):
-        """
-        Determine if a current player is in check
-        """
-        if self.whiteToMove:
-            return self.squareUnderAttack(self.whiteKing[0], self.whiteKing[1])
-        else:
-            return self.squareUnderAttack(self.blackKing[0], self.blackKing[1])
-
-    def squareUnderAttack(self, row, col):
-        """
-        Determine if enemy can attack the square row col
-        """
-        self.whiteToMove = not self.whiteToMove  # switch to opponent's point of view
-        opponents_moves = self.getPossibleMoves()
-        self.whiteToMove = not self.whiteToMove        
-        for move in opponents_moves:
-            if move.endRow == row and move.endCol == col:  # square is under attack
-                return True
-        return False
-
-
     '''
-    Without considering checks
+    Draws
+    keyCounts is updated by every pushMove and popMove, so how often the position has been
+    on the board is one dictionary lookup. The search scores a position as a draw as soon as
+    it repeats once - if the repetition is good for one side it can be repeated again.
     '''
-    def getPossibleMoves(self):
+    def repetitionCount(self):
+        #times the current position has been on the board, this time included
+        return self.keyCounts.get(self.zobristKey, 0)
+
+    def isRepetition(self):
+        return self.keyCounts.get(self.zobristKey, 0) > 1
+
+    def isInsufficientMaterial(self):
+        #neither side can mate: lone kings, a single minor piece, or only bishops all on one colour of square
+        pieceBB = self.pieceBB
+        if pieceBB[WP] | pieceBB[BP] | pieceBB[WR] | pieceBB[BR] | pieceBB[WQ] | pieceBB[BQ]:
+            return False
+        knights = pieceBB[WN] | pieceBB[BN]
+        bishops = pieceBB[WB] | pieceBB[BB]
+        if popcount(knights | bishops) <= 1:
+            return True
+        if knights:
+            return False
+        return not bishops & LIGHT_SQUARES or not bishops & ~LIGHT_SQUARES
+
+    def generateMoves(self, capturesOnly=False):
+        '''
+        Every legal move as a packed int. Checkers and pinned pieces are found with reverse
+        attack lookups from the king square, so every move produced here is already legal.
+        capturesOnly leaves out quiet moves and castling but keeps promotions, for the quiescence
+        search. In check it still returns every evasion, the side to move has no other choice.
+        Also sets self.in_check.
+        '''
         moves = []
-        for r in range(len(self.board)): #number of row
-            for c in range(len(self.board[r])): #number of columns
-                turn = self.board[r][c][0] #either black or white b/w
-                if (turn == 'w' and self.whiteToMove == True) or (turn == 'b' and not self.whiteToMove == True):
-                    piece = self.board[r][c][1] 
-
-                    '''this looks for the piece on the board and matches each to the 
-                    possible moves generated in the functions below'''
-
-                    self.moveFunctions[piece](r, c, moves)
-        return moves
-
-    '''
-    Get all the possible moves for the piece located at r, c then add the moves to the list
-    '''
-
-    '''----------------------------------------------------------------'''
-
-    '''
-    Get all the possible PAWN moves
-    '''
-    def getPawnMoves(self, r, c, moves):
-
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        #move one forwards
-        #move two forward on move one
-        if self.whiteToMove:
-            '''
-            check if square in front is empty
-            consider the pawn is on e2. since the column is the same when moving, c is not changed
-            but the row is the one changing. since the row goes from 8 at the bottom (see class move)
-            it goes r-1
-            '''
-            if self.board[r-1][c] == '--': #1 square pawn advance
-                if not piece_pinned or pin_direction == (-1,0):
-                    moves.append(Move((r, c), (r-1, c), self.board))
-                    if r == 6 and self.board[r-2][c] == '--': 
-                    #if pawn is at starting sq, r6 and two spaces above is empty, twosq pawn move
-                        moves.append(Move((r,c), (r-2, c), self.board))
-            '''capturing'''
-            if c-1 >= 0: #left captures
-                if self.board[r-1][c-1][0] == 'b': #first character is labelled black
-                    if not piece_pinned or pin_direction == (-1,-1):
-                        moves.append(Move((r,c), (r-1, c-1), self.board))
-                elif (r-1, c-1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r-1, c-1), self.board, isEnPassantMove=True))
-
-            if c+1 <= 7: #right captures
-                if self.board[r-1][c+1][0] == 'b':
-                    if not piece_pinned or pin_direction == (-1, 1):
-                        moves.append(Move((r,c), (r-1, c+1), self.board))
-                elif (r-1, c+1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r-1, c+1), self.board, isEnPassantMove=True))
-
-
-        if not self.whiteToMove:
-            '''
-            check if square in back is empty
-            consider the pawn is on e7. since the column is the same when moving, c is not changed
-            but the row is the one changing. since the row goes from 8 at the bottom (see class move)
-            it goes r-1
-            '''
-            if self.board[r+1][c] == '--': #1 square pawn advance
-                if not piece_pinned or pin_direction == (1,0):
-                    moves.append(Move((r, c), (r+1, c), self.board))
-                    if r == 1 and self.board[r+2][c] == '--': 
-                        #if pawn is at starting sq, r6 and two spaces above is empty, twosq pawn move
-                        moves.append(Move((r,c), (r+2, c), self.board))
-            '''capturing'''
-            if c-1 >= 0: #left captures
-                if self.board[r+1][c-1][0] == 'w': #first character is labelled black
-                    if not piece_pinned or pin_direction == (1,-1):
-                        moves.append(Move((r,c), (r+1, c-1), self.board))
-                elif (r+1, c-1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r+1, c-1), self.board, isEnPassantMove=True))
-
-            if c+1 <= 7: #right captures
-                if self.board[r+1][c+1][0] == 'w':
-                    if not piece_pinned or pin_direction == (1,1):
-                        moves.append(Move((r,c), (r+1, c+1), self.board))
-                elif (r+1, c+1) == self.enPassantPossible:
-                    moves.append(Move((r,c), (r+1, c+1), self.board, isEnPassantMove=True))
-
-    '''
-    Get all the possible ROOK moves
-    '''
-    def getRookMoves(self, r, c, moves):
-        '''adds directions to four sides, so each move is just a repeat of these'''
-        '''forming (r,c)'''
-
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                if self.board[r][c][1] != "Q":  # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
-
-        dirs = ((1,0), (-1,0), (0,1), (0,-1)) #down, up, right, left
-        enemyColor = 'b' if self.whiteToMove else 'w'
-
-        '''if white, black. if black, white.'''
-
-        for d in dirs:
-            for i in range(1, 8):#just a simple for loop
-                endRow = r+d[0]*i 
-                '''
-                #the for loop adds one to i every loop. because of this,
-                #the endrow contains the possible rows a rook can go to.
-                #in 'dirs', index 0 represents the row, going from 0 to 8, up and down.
-                #the same goes for endcol.
-                
-
-                #'r' and 'c' are variables holding the current rook's position.
-                #Thus, we keep adding rows to 'r' and columns to 'c' as a rook can
-                #travel through rows or columns indefinitely.
-                '''
-                
-                endCol = c+d[1]*i  
-                
-                '''
-                #endRow MUST only go from 0 to 7, as does endCol as seen in object Move
-                #This is why it is important to compare and keep adding to the rook's current position 
-                #to see how far it can travel down a row or column.
-                '''
-
-                if 0 <= endRow < 8 and 0<= endCol < 8: 
-                    #if it is on the board'''
-                    if not piece_pinned or pin_direction == [d] or pin_direction == (-d[0], -d[1]):
-                    #move towards and away from the pin
-                        obstaclePiece = self.board[endRow][endCol]
-                        if obstaclePiece == '--': #if there are no obstacles,
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            #this is still in the for loop, so the possible moves keep getting added'''
-                        elif obstaclePiece[0] == enemyColor:
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            break 
-                            #if there is an enemy obstacle piece. 
-                            #append this final valid move where it gets to the enemy's square, a capture!
-                            #then break because you can't jump over pieces with a rook
-                        else:
-                            break
-                            #can't capture non-enemy pieces
-                else:
-                    break
-                    #stop adding new possible moves once it gets out of the board's range
-    
-    '''
-    Get all the possible KNIGHT moves
-    '''
-    def getKnightMoves(self, r, c, moves):
-
-        piece_pinned = False
-        for i in range(len(self.pins)-1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                self.pins.remove(self.pins[i])
-                break
-
-        knightMoves = ((2,1), (2,-1),(-2,1), (-2,-1),
-                        (1,2), (1,-2),(-1,2), (-1,-2))
-        ally_color = "w" if self.whiteToMove else "b"
-        
-        for move in knightMoves:
-            endRow = r+move[0]
-            endCol = c+move[1]
-            if 0 <= endRow < 8 and 0<= endCol < 8:  
-                if not piece_pinned:
-                        end_piece = self.board[endRow][endCol]
-                        if end_piece[0] != ally_color:  # so its either enemy piece or empty square
-                            moves.append(Move((r, c), (endRow, endCol), self.board))
-    '''
-    Get all the possible BISHOP moves
-    '''
-    def getBishopMoves(self, r, c, moves):
-
-        piece_pinned = False
-        pin_direction = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == r and self.pins[i][1] == c:
-                piece_pinned = True
-                pin_direction = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
-        '''adds directions to four sides, so each move is just a repeat of these'''
-        '''forming (r,c)'''
-
-        dirs = ((1,1), (1,-1), (-1,1), (-1,-1)) #topright, topleft, bottomright, bottomleft
-        enemyColor = 'b' if self.whiteToMove else 'w'
-
-        '''if white, black. if black, white.'''
-        for d in dirs:
-            for i in range(1, 8):
-                endRow =r + d[0]*i
-                endCol = c + d[1]*i
-                if 0<=endRow<8 and 0<=endCol<8:
-                    if not piece_pinned or pin_direction == [d] or pin_direction == (-d[0], -d[1]):
-                        obstaclePiece = self.board[endRow][endCol]
-                        if obstaclePiece == '--': #if there are no obstacles,
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            '''this is still in the for loop, so the possible moves keep getting added'''
-                        elif obstaclePiece[0] == enemyColor:
-                            moves.append(Move((r,c), (endRow, endCol), self.board))
-                            break 
-                            '''if there is an enemy obstacle piece. 
-                            Add this final valid move where it gets to the enemy's square, a capture!
-                            then break because you can't jump over pieces with a rook'''
-                        else:
-                            break
-                            '''can't capture non-enemy pieces'''
-                else:
-                    break
-                    '''stop adding new possible moves once it gets out of the board's range'''
-
-    '''
-    Get all the possible QUEEN moves
-    '''
-    def getQueenMoves(self, r, c, moves):
-        self.getRookMoves(r, c, moves)
-        self.getBishopMoves(r, c, moves)
-
-    '''
-    Get all the possible KING moves
-    '''
-    def getKingMoves(self, r, c, moves):
-        row_moves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        col_moves = (-1, 0, 1, -1, 1, -1, 0, 1)
-        ally_color = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            end_row = r + row_moves[i]
-            end_col = c + col_moves[i]
-            if 0 <= end_row <= 7 and 0 <= end_col <= 7:
-                end_piece = self.board[end_row][end_col]
-                if end_piece[0] != ally_color:  # not an ally piece - empty or enemy
-                    # place king on end square and check for checks
-                    if ally_color == "w":
-                        self.whiteKing = (end_row, end_col)
-                    else:
-                        self.blackKing = (end_row, end_col)
-                    in_check, pins, checks = self.checkForPinsAndChecks()
-                    if not in_check:
-                        moves.append(Move((r, c), (end_row, end_col), self.board))
-                    # place king back on original location
-                    if ally_color == "w":
-                        self.whiteKing = (r, c)
+        append = moves.append
+        pieceBB = self.pieceBB
+        us = WHITE if self.whiteToMove else BLACK
+        them = us ^ 1
+        ours = self.colourBB[us]
+        theirs = self.colourBB[them]
+        occ = ours | theirs
+        base = 6*us
+        enemyBase = 6*them
+        captureFlag = CAPTURE << 12
+
+        kingSq = lsb(pieceBB[base+5])
+        checkers = self.attackersTo(kingSq, them, occ)
+        self.in_check = checkers != 0
+        quiets = not capturesOnly or checkers != 0
+        quietMask = ~theirs if quiets else 0 #targets that capture nothing
+
+        #king steps - lift the king off the board so it can't hide from a slider behind itself
+        occNoKing = occ ^ (1 << kingSq)
+        for to in squares(KING_ATTACKS[kingSq] & ~ours & (theirs | quietMask)):
+            if not self.attackersTo(to, them, occNoKing):
+                append(kingSq | to << 6 | (captureFlag if theirs >> to & 1 else 0))
+
+        if checkers & (checkers - 1): #in double check only the king can move
+            return moves
+        if checkers:
+            #capture the checker or block the line between it and the king
+            checkMask = checkers | BETWEEN[kingSq][lsb(checkers)]
+        else:
+            checkMask = FULL
+        targetMask = ~ours & checkMask
+
+        #pinned pieces - enemy sliders that would see the king through exactly one of our pieces
+        enemyRooks = pieceBB[enemyBase+3] | pieceBB[enemyBase+4]
+        enemyBishops = pieceBB[enemyBase+2] | pieceBB[enemyBase+4]
+        pinned = 0
+        for sniper in squares((rookAttacks(kingSq, theirs) & enemyRooks) | (bishopAttacks(kingSq, theirs) & enemyBishops)):
+            blockers = BETWEEN[kingSq][sniper] & occ
+            if blockers & (blockers - 1) == 0 and blockers & ours:
+                pinned |= blockers
+
+        #knights - a pinned knight can never move
+        for frm in squares(pieceBB[base+1] & ~pinned):
+            targets = KNIGHT_ATTACKS[frm] & targetMask
+            for to in squares(targets & theirs):
+                append(frm | to << 6 | captureFlag)
+            for to in squares(targets & quietMask):
+                append(frm | to << 6)
+
+        #bishops, rooks and queens - pinned sliders may only move along the pin line
+        for frm in squares(pieceBB[base+2] | pieceBB[base+4]):
+            targets = bishopAttacks(frm, occ) & targetMask
+            if pinned >> frm & 1:
+                targets &= LINE[kingSq][frm]
+            for to in squares(targets & theirs):
+                append(frm | to << 6 | captureFlag)
+            for to in squares(targets & quietMask):
+                append(frm | to << 6)
+        for frm in squares(pieceBB[base+3] | pieceBB[base+4]):
+            targets = rookAttacks(frm, occ) & targetMask
+            if pinned >> frm & 1:
+                targets &= LINE[kingSq][frm]
+            for to in squares(targets & theirs):
+                append(frm | to << 6 | captureFlag)
+            for to in squares(targets & quietMask):
+                append(frm | to << 6)
+
+        #pawns
+        forward = -8 if us == WHITE else 8
+        startRow = 6 if us == WHITE else 1
+        lastRow = 0 if us == WHITE else 7
+        epSq = self.epSquare
+        for frm in squares(pieceBB[base]):
+            allowed = checkMask & LINE[kingSq][frm] if pinned >> frm & 1 else checkMask
+            one = frm + forward
+            promotes = one >> 3 == lastRow
+            if not occ >> one & 1 and (quiets or promotes): #1 square pawn advance
+                if allowed >> one & 1:
+                    if promotes:
+                        for piece in range(4):
+                            append(frm | one << 6 | (PROMOTION + piece) << 12)
                     else:
-                        self.blackKing = (r, c)
-
-    #get valid castle moves for w/b king at r, c and add to move list
-    def getCastleMoves(self, r, c, moves):
-        if self.squareUnderAttack(r, c):
-            return #return nothing if in check
-        
-        #if not elif statements will be used as both king and queenside castle moves are possible simultaneously
-
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
-            #if white to move and wks is castle-able or if b to move and bks is castle-able, get kingside castle moves
-            self.getKingSideCastleMoves(r, c, moves)
-
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
-            #if white to move and wks is castle-able or if b to move and bks is castle-able, get kingside castle moves
-            self.getQueenSideCastleMoves(r, c, moves)
+                        append(frm | one << 6)
+                two = one + forward
+                if quiets and frm >> 3 == startRow and not occ >> two & 1 and allowed >> two & 1:
+                    append(frm | two << 6 | DOUBLE_PAWN_PUSH << 12)
+            for to in squares(PAWN_ATTACKS[us][frm] & theirs & allowed): #captures
+                if promotes:
+                    for piece in range(4):
+                        append(frm | to << 6 | (PROMOTION_CAPTURE + piece) << 12)
+                else:
+                    append(frm | to << 6 | captureFlag)
+            if epSq >= 0 and PAWN_ATTACKS[us][frm] >> epSq & 1:
+                capturedSq = epSq - forward
+                #in check the capture must either take the checking pawn or block the check
+                if checkers and not checkers >> capturedSq & 1 and not checkMask >> epSq & 1:
+                    continue
+                #both pawns leave the rank at once, so test the king against sliders on the new occupancy
+                after = (occ ^ (1 << frm) ^ (1 << capturedSq)) | (1 << epSq)
+                if not (rookAttacks(kingSq, after) & enemyRooks) and not (bishopAttacks(kingSq, after) & enemyBishops):
+                    append(frm | epSq << 6 | EN_PASSANT << 12)
+
+        #castling - never out of, through or into check
+        if quiets and not checkers:
+            kingSide = self.castling & (WKS if us == WHITE else BKS)
+            queenSide = self.castling & (WQS if us == WHITE else BQS)
+            if kingSide and not occ >> (kingSq+1) & 1 and not occ >> (kingSq+2) & 1:
+                if not self.attackersTo(kingSq+1, them, occ) and not self.attackersTo(kingSq+2, them, occ):
+                    append(kingSq | (kingSq+2) << 6 | KING_CASTLE << 12)
+            if queenSide and not occ >> (kingSq-1) & 1 and not occ >> (kingSq-2) & 1 and not occ >> (kingSq-3) & 1:
+                if not self.attackersTo(kingSq-1, them, occ) and not self.attackersTo(kingSq-2, them, occ):
+                    append(kingSq | (kingSq-2) << 6 | QUEEN_CASTLE << 12)
 
-    def getKingSideCastleMoves(self, r, c, moves):
-        #check two square at the right of the king (kingside) - has to be empty
-        if self.board[r][c+1] == '--' and self.board[r][c+2] == '--':
-            if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c+2):
-                moves.append(Move((r, c), (r, c + 2), self.board, isCastleMove = True))
+        return moves
 
-        
-    def getQueenSideCastleMoves(self, r, c, moves):
-        #three squares to the left must be checked, as the (r, c-3) will occupy the rook movement
-        if self.board[r][c-1] == '--' and self.board[r][c-2] == '--' and self.board[r][c-3] == '--':
-            if not self.squareUnderAttack(r, c-1) and not self.squareUnderAttack(r, c-2):
-                moves.append(Move((r, c), (r, c-2), self.board, isCastleMove = True))
+    def attackersTo(self, sq, colour, occ):
+        '''
+        Bitboard of colour's pieces that attack sq, given the occupancy occ.
+        Works backwards from the target square: a knight on sq would attack exactly the
+        squares an enemy knight attacks it from, and the same holds for every other piece.
+        '''
+        pieceBB = self.pieceBB
+        base = 6*colour
+        return ((PAWN_ATTACKS[colour ^ 1][sq] & pieceBB[base]) |
+                (KNIGHT_ATTACKS[sq] & pieceBB[base+1]) |
+                (bishopAttacks(sq, occ) & (pieceBB[base+2] | pieceBB[base+4])) |
+                (rookAttacks(sq, occ) & (pieceBB[base+3] | pieceBB[base+4])) |
+                (KING_ATTACKS[sq] & pieceBB[base+5]))
+
+    def isSquareAttacked(self, sq, colour, occ=None):
+        #reverse lookup, for any occupancy - e.g. with a piece lifted off the board
+        if occ is None:
+            occ = self.colourBB[WHITE] | self.colourBB[BLACK]
+        return self.attackersTo(sq, colour, occ) != 0
 
 '''----------------------------------------------------------------'''
 
@@ -656,7 +900,7 @@ class Move():
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
 
-    def __init__(self, startsq, endsq, board, isEnPassantMove = False, isCastleMove = False):
+    def __init__(self, startsq, endsq, board, isEnPassantMove = False, isCastleMove = False, promotionPiece = ''):
         self.startRow = startsq[0]
         self.startCol = startsq[1]
 
@@ -669,7 +913,7 @@ class Move():
         self.isPawnPromotion = False
         if (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7): #pawn promotion
             self.isPawnPromotion = True
-        self.promotionPiece = ''
+        self.promotionPiece = promotionPiece #'Q', 'R', 'B' or 'N' for a promotion, '' for any other move
         self.isEnPassantMove = isEnPassantMove
         if self.isEnPassantMove:
             # print(self.isEnPassantMove)
@@ -681,16 +925,36 @@ class Move():
         # print(self.moveID)
         #between 0 and 7777
     '''
-    overriding the equals method
+    overriding the equals method - the four promotions on a square are different moves
     '''
     def __eq__(self, other):
         if isinstance(other, Move):
-            return self.moveID == other.moveID
+            return self.moveID == other.moveID and self.promotionPiece == other.promotionPiece
         return False
 
+    def getCode(self):
+        #the packed 16 bit form of the move, see encodeMove
+        if self.isCastleMove:
+            flag = KING_CASTLE if self.endCol > self.startCol else QUEEN_CASTLE
+        elif self.isEnPassantMove:
+            flag = EN_PASSANT
+        elif self.isPawnPromotion:
+            flag = (PROMOTION if self.pieceCaptured == '--' else PROMOTION_CAPTURE) + promotionPieces.index(self.promotionPiece)
+        elif self.pieceCaptured != '--':
+            flag = CAPTURE
+        elif self.pieceMoved[1] == 'p' and abs(self.startRow - self.endRow) == 2:
+            flag = DOUBLE_PAWN_PUSH
+        else:
+            flag = QUIET
+        return encodeMove(self.startRow*8 + self.startCol, self.endRow*8 + self.endCol, flag)
+
     def getRankFile(self, row, column):
         return self.colsToFiles[column] + self.rowsToRanks[row] #it's f3 not 3f
 
+    def getUciNotation(self):
+        #long algebraic notation - start square, end square and promotion piece, e.g. e2e4 or e7e8q
+        return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol) + self.promotionPiece.lower()
+
     def getChessNotation(self):
         #PGN NOTATION 
         #Abnormal Moves
@@ -698,7 +962,7 @@ class Move():
             notatedMove = self.getRankFile(self.endRow, self.endCol) + '=' + self.promotionPiece
             return notatedMove
         if self.isCastleMove:
-            if self.endCol == 1: #queenside castled kings are in column 1
+            if self.endCol == 2: #queenside castled kings are in column 2, the c file
                 notatedMove = 'O-O-O'
                 return notatedMove
             else:
@@ -0,0 +1,201 @@
+'''
+Evaluation tables used by GameState and the search in chessai.
+Every piece on every square is worth its material plus a piece-square bonus, once for the
+middlegame and once for the endgame. GameState keeps the sum of both up to date in pushMove
+and popMove, together with the game phase, so evaluating a position costs no board scan:
+the two sums are blended by how much material is left (a tapered evaluation).
+Scores are in centipawns from white's point of view.
+'''
+from chessbitboard import WHITE, BLACK, FULL, PAWN_ATTACKS, pieceNames, popcount, squares
+
+'''
+Packed scores
+The middlegame and endgame values of a piece-square are packed into one int, the endgame part
+shifted up 16 bits, so one addition updates both. The middlegame part is read back sign-extended
+from the low 16 bits, the endgame part is what is left above them.
+'''
+def packScore(mg, eg):
+    return (eg << 16) + mg
+
+def middlegame(score):
+    return ((score + 0x8000) & 0xFFFF) - 0x8000
+
+def endgame(score):
+    return (score - middlegame(score)) >> 16
+
+#material, middlegame and endgame - pawn, knight, bishop, rook, queen, king
+materialMg = {'p': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+materialEg = {'p': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+
+#game phase - 24 with all the pieces on the board, 0 with only kings and pawns
+phaseValues = {'p': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+TOTAL_PHASE = 24
+
+'''
+Piece-square tables, from white's side with rank 8 first - the same layout as GameState.board.
+Black uses the table mirrored top to bottom.
+'''
+pawnMg = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     10,  10,  20,  30,  30,  20,  10,  10,
+      5,   5,  10,  25,  25,  10,   5,   5,
+      0,   0,   0,  20,  20,   0,   0,   0,
+      5,  -5, -10,   0,   0, -10,  -5,   5,
+      5,  10,  10, -20, -20,  10,  10,   5,
+      0,   0,   0,   0,   0,   0,   0,   0]
+
+pawnEg = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+     80,  80,  80,  80,  80,  80,  80,  80,
+     50,  50,  50,  50,  50,  50,  50,  50,
+     30,  30,  30,  30,  30,  30,  30,  30,
+     15,  15,  15,  15,  15,  15,  15,  15,
+      5,   5,   5,   5,   5,   5,   5,   5,
+      0,   0,   0,   0,   0,   0,   0,   0,
+      0,   0,   0,   0,   0,   0,   0,   0]
+
+knight = [
+    -50, -40, -30, -30, -30, -30, -40, -50,
+    -40, -20,   0,   0,   0,   0, -20, -40,
+    -30,   0,  10,  15,  15,  10,   0, -30,
+    -30,   5,  15,  20,  20,  15,   5, -30,
+    -30,   0,  15,  20,  20,  15,   0, -30,
+    -30,   5,  10,  15,  15,  10,   5, -30,
+    -40, -20,   0,   5,   5,   0, -20, -40,
+    -50, -40, -30, -30, -30, -30, -40, -50]
+
+bishop = [
+    -20, -10, -10, -10, -10, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,  10,  10,   5,   0, -10,
+    -10,   5,   5,  10,  10,   5,   5, -10,
+    -10,   0,  10,  10,  10,  10,   0, -10,
+    -10,  10,  10,  10,  10,  10,  10, -10,
+    -10,   5,   0,   0,   0,   0,   5, -10,
+    -20, -10, -10, -10, -10, -10, -10, -20]
+
+rook = [
+      0,   0,   0,   0,   0,   0,   0,   0,
+      5,  10,  10,  10,  10,  10,  10,   5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+     -5,   0,   0,   0,   0,   0,   0,  -5,
+      0,   0,   0,   5,   5,   0,   0,   0]
+
+queen = [
+    -20, -10, -10,  -5,  -5, -10, -10, -20,
+    -10,   0,   0,   0,   0,   0,   0, -10,
+    -10,   0,   5,   5,   5,   5,   0, -10,
+     -5,   0,   5,   5,   5,   5,   0,  -5,
+      0,   0,   5,   5,   5,   5,   0,  -5,
+    -10,   5,   5,   5,   5,   5,   0, -10,
+    -10,   0,   5,   0,   0,   0,   0, -10,
+    -20, -10, -10,  -5,  -5, -10, -10, -20]
+
+#the king hides behind its pawns while there are pieces to attack it, and walks to the centre after
+kingMg = [
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -30, -40, -40, -50, -50, -40, -40, -30,
+    -20, -30, -30, -40, -40, -30, -30, -20,
+    -10, -20, -20, -20, -20, -20, -20, -10,
+     20,  20,   0,   0,   0,   0,  20,  20,
+     20,  30,  10,   0,   0,  10,  30,  20]
+
+kingEg = [
+    -50, -40, -30, -20, -20, -30, -40, -50,
+    -30, -20, -10,   0,   0, -10, -20, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  30,  40,  40,  30, -10, -30,
+    -30, -10,  20,  30,  30,  20, -10, -30,
+    -30, -30,   0,   0,   0,   0, -30, -30,
+    -50, -30, -30, -30, -30, -30, -30, -50]
+
+tablesMg = {'p': pawnMg, 'N': knight, 'B': bishop, 'R': rook, 'Q': queen, 'K': kingMg}
+tablesEg = {'p': pawnEg, 'N': knight, 'B': bishop, 'R': rook, 'Q': queen, 'K': kingEg}
+
+#pieceSquare[piece][sq] - packed material plus table score, negative for black pieces
+pieceSquare = []
+#phaseWeight[piece] - how much the piece counts towards the game phase
+phaseWeight = []
+for _name in pieceNames:
+    _kind = _name[1]
+    _mirror = 0 if _name[0] == 'w' else 56 #sq ^ 56 flips the rank
+    _sign = 1 if _name[0] == 'w' else -1
+    pieceSquare.append([_sign*packScore(materialMg[_kind] + tablesMg[_kind][sq ^ _mirror],
+                                        materialEg[_kind] + tablesEg[_kind][sq ^ _mirror]) for sq in range(64)])
+    phaseWeight.append(phaseValues[_kind])
+del _name, _kind, _mirror, _sign
+
+def taper(score, phase):
+    #blends the packed score by the phase, from white's point of view
+    phase = min(phase, TOTAL_PHASE) #early promotions can push the phase past the start
+    return (middlegame(score)*phase + endgame(score)*(TOTAL_PHASE - phase)) // TOTAL_PHASE
+
+'''
+Pawn structure
+Scored from the two pawn bitboards alone, so the result only changes when a pawn moves or
+is taken and the search can cache it by GameState.pawnKey (see chessai.PawnTable).
+White pawns move up the board (towards row 0), black pawns down.
+'''
+doubledPawn = packScore(-10, -20) #for every pawn with a pawn of its own colour in front of it
+isolatedPawn = packScore(-10, -15) #no pawns of its own colour on the files next to it
+backwardPawn = packScore(-8, -10) #can't be defended by a pawn and its stop square is attacked by one
+#passed pawn bonus by rank counted from its own side, 0 is the first rank
+passedPawn = [packScore(mg, eg) for mg, eg in ((0, 0), (5, 10), (10, 20), (20, 40), (35, 70), (60, 120), (100, 200), (0, 0))]
+#own pawns in front of the king, one and two squares ahead - only matters while there are pieces to attack it
+shieldPawn = [packScore(10, 0), packScore(5, 0)]
+
+FILE_BB = [sum(1 << (r*8 + c) for r in range(8)) for c in range(8)]
+ADJACENT_FILES = [(FILE_BB[c-1] if c > 0 else 0) | (FILE_BB[c+1] if c < 7 else 0) for c in range(8)]
+
+def _rowsAhead(colour, row):
+    #every square on the rows in front of row, seen from colour
+    rows = range(row) if colour == WHITE else range(row + 1, 8)
+    return sum(0xFF << (r*8) for r in rows)
+
+#FRONT_SPAN[colour][sq] - the squares in front of a pawn on its own file
+FRONT_SPAN = [[_rowsAhead(colour, sq >> 3) & FILE_BB[sq & 7] for sq in range(64)] for colour in (WHITE, BLACK)]
+#PASSED_SPAN[colour][sq] - enemy pawns here stop the pawn on sq from being passed
+PASSED_SPAN = [[_rowsAhead(colour, sq >> 3) & (FILE_BB[sq & 7] | ADJACENT_FILES[sq & 7]) for sq in range(64)] for colour in (WHITE, BLACK)]
+#SUPPORT_SPAN[colour][sq] - pawns of the same colour here can still come up and defend the pawn on sq
+SUPPORT_SPAN = [[~_rowsAhead(colour, sq >> 3) & ADJACENT_FILES[sq & 7] & FULL for sq in range(64)] for colour in (WHITE, BLACK)]
+
+def _shieldRow(colour, sq, distance):
+    #the king's file and the files next to it, distance rows in front of sq
+    row = (sq >> 3) - distance if colour == WHITE else (sq >> 3) + distance
+    if not 0 <= row < 8:
+        return 0
+    return 0xFF << (row*8) & (FILE_BB[sq & 7] | ADJACENT_FILES[sq & 7])
+
+#SHIELD[colour][sq] - the shield squares one and two rows in front of a king on sq
+SHIELD = [[(_shieldRow(colour, sq, 1), _shieldRow(colour, sq, 2)) for sq in range(64)] for colour in (WHITE, BLACK)]
+
+def _pawnSide(colour, own, enemy):
+    score = 0
+    forward = -8 if colour == WHITE else 8
+    for sq in squares(own):
+        c = sq & 7
+        if own & FRONT_SPAN[colour][sq]:
+            score += doubledPawn
+        elif not enemy & PASSED_SPAN[colour][sq]: #only the front pawn of a file can be passed
+            score += passedPawn[7 - (sq >> 3) if colour == WHITE else sq >> 3]
+        if not own & ADJACENT_FILES[c]:
+            score += isolatedPawn
+        elif not own & SUPPORT_SPAN[colour][sq] and PAWN_ATTACKS[colour][sq + forward] & enemy:
+            score += backwardPawn
+    return score
+
+def evaluatePawns(whitePawns, blackPawns):
+    #packed pawn structure score from white's point of view
+    return _pawnSide(WHITE, whitePawns, blackPawns) - _pawnSide(BLACK, blackPawns, whitePawns)
+
+def kingShield(colour, kingSq, pawns):
+    #packed score for the pawns of colour sheltering its king
+    shield = SHIELD[colour][kingSq]
+    return popcount(pawns & shield[0])*shieldPawn[0] + popcount(pawns & shield[1])*shieldPawn[1]
@@ -1,8 +1,12 @@
 import pygame as pg
+import os
 import sys
 import random
+import queue
+import threading
+import time
 from random import randint
-import chessengine, chessai
+import chessengine, chessai, chessbook, chessclock, chesspgn, chesstablebase
 
 # GAME VARIABLES
 # pixel sizes
@@ -35,6 +39,15 @@ selectedColor = (186,202,68)
 #numerical values
 maxFps = 10
 dimension = 8
+botMoveTime = 2 #seconds the bot thinks per move without a clock, one of chessclock.PER_MOVE_TIMES
+gameTimeControl = 'Blitz II' #one of chessclock.TIME_CONTROLS, None to play without a clock
+gameIncrement = 0 #seconds added to a side's clock after each of its moves
+botWorkers = 1 #processes the bot searches with, raise it on multi-core machines
+botPonder = True #let the bot think on the human's time, see BotThinker
+botEvalCacheMB = 16 #memory for the bot's evaluation cache, kept for the whole game
+botBookPath = 'book.bin' #Polyglot opening book, without the file the bot searches from the first move
+botTablebasePath = 'tablebases' #endgame tables made by python chesstablebase.py, without them the bot searches endgames too
+gamePgnPath = 'games.pgn' #P appends the game to this file, L loads the last game in it back
 
 #positions
 # boardx = swidth/2 - (squareSize*dimension/2) 
@@ -64,6 +77,7 @@ def main():
     moveMade = False
     gameOver = False
     loadImages()
+    renderer = Renderer(screen)
     game_over = False
     playerOne = True
     #if human is white, this is true, if AI is playing then false
@@ -73,15 +87,18 @@ def main():
 
     sqselected = () #last click of the user
     playerClicks = [] #two tuples, keeping track of the player clicks, for instance, (6,4), (4,4) => pawn moves 2
-    drawEndGameText(screen, "White to move")
+    status = "White to move" #the text above the move log
     running = True
-    whiteMoveTime = 0
-    blackMoveTime = 0
-
-    moveLogFont = pg.font.Font("Product Sans Regular.ttf", 12)
-    btnFont = pg.font.Font("FontsFree-Net-SFProDisplay-Regular (2).ttf", 25)
+    gameClock = newClock() #starts with white's first move, None without a time control
 
     notatedmoveLog = []
+    thinker = None #BotThinker while the bot is searching
+    ponderer = None #pondering BotThinker while the human thinks
+    ponderMove = None #the reply the bot expects, pondered on once the position after its move is known to go on
+    promotionChoices = [] #the four promotion moves while the picker is open
+    evalCache = chessai.EvalCache(botEvalCacheMB) #warm from one move to the next, cleared for a new game
+    book = chessbook.openBook(botBookPath)
+    tablebases = chesstablebase.openTablebases(botTablebasePath)
 
     alliedColour = 'w' if gs.whiteToMove else 'b'
 
@@ -91,317 +108,576 @@ def main():
             if event.type == pg.QUIT:
                 running = False
             elif event.type == pg.MOUSEBUTTONDOWN:
-                if not gameOver and isHumanTurn: #allow mouse algo to pass only if human turn. AI can use makeMove()
+                if not gameOver: #buttons work while the bot thinks too, they cancel its search
                     mouseloc = pg.mouse.get_pos()
 
                     if undoBtnRect.collidepoint(mouseloc):
+                        thinker = cancelThinking(thinker)
+                        ponderer = cancelThinking(ponderer)
                         gs.undoMove()
+                        restartClock(gameClock, gs)
                         gameOver = False
                         if len(notatedmoveLog)>0:
                             notatedmoveLog.pop()
-                        drawMoveLog(screen, notatedmoveLog, moveLogFont)
                         moveMade = True
                         game_over = False
 
                     if resetBtnRect.collidepoint(mouseloc):
+                        thinker = cancelThinking(thinker)
+                        ponderer = cancelThinking(ponderer)
+                        evalCache.clear()
+                        gameClock = newClock()
                         gs = chessengine.GameState()
                         validMoves = gs.getValidMoves()
                         sqselected = ()
                         playerClicks = []
                         moveMade = False
                         gameOver = False
-                        if len(notatedmoveLog)>0:
-                            notatedmoveLog.clear()
-                            drawMoveLog(screen, notatedmoveLog, moveLogFont)
+                        status = "White to move"
+                        notatedmoveLog.clear()
 
                     if resignBtnRect.collidepoint(mouseloc):
+                        thinker = cancelThinking(thinker)
+                        ponderer = cancelThinking(ponderer)
                         gameOver = True
-                        if gs.whiteToMove:
-                            resetText(screen, 'White to move')
-                            drawEndGameText(screen, "Black wins by resignation")
-                            drawMoveLog(screen, notatedmoveLog, moveLogFont)
-                        elif not gs.whiteToMove:
-                            resetText(screen, 'Black to move')
-                            drawEndGameText(screen, "White wins by resignation")
-                            drawMoveLog(screen, notatedmoveLog, moveLogFont)      
+                        stopClock(gameClock)
+                        #on the bot's turn it is the human who resigns, not the side to move
+                        whiteResigns = gs.whiteToMove if isHumanTurn else playerOne
+                        if whiteResigns:
+                            status = "Black wins by resignation"
+                        else:
+                            status = "White wins by resignation"
 
                     if drawBtnRect.collidepoint(mouseloc):
-                        gameOver = True     
-                        resetText(screen, 'Black to move')
-                        resetText(screen, 'White to move')
-                        drawEndGameText(screen, "Drawn by agreement")
-                        drawMoveLog(screen, notatedmoveLog, moveLogFont)
+                        thinker = cancelThinking(thinker)
+                        ponderer = cancelThinking(ponderer)
+                        gameOver = True
+                        stopClock(gameClock)
+                        status = "Drawn by agreement"
 
 
-                    col = mouseloc[0]//squareSize
-                    row = mouseloc[1]//squareSize
+                    chosenMove = None
+                    if promotionChoices: #the picker is open - a click on it picks the piece, anywhere else closes it
+                        chosenMove = pickPromotion(mouseloc, promotionChoices)
+                        promotionChoices = []
+                        sqselected = ()
+                        playerClicks = []
+                    elif isHumanTurn: #board clicks only on the human's turn. AI can use makeMove()
+                        col = mouseloc[0]//squareSize
+                        row = mouseloc[1]//squareSize
 
                 
-                    if sqselected == (row,col) or col >= 8: #if click, select, if its the same square, deselect
-                        sqselected = () #deselect, empty
-                        playerClicks = []
-                    else:
-                        sqselected = (row, col)
-                        playerClicks.append(sqselected) 
-                    if len(playerClicks) == 2: #this is the second click
-                        move = chessengine.Move(playerClicks[0], playerClicks[1], gs.board)
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                if gs.in_check:
-                                    notatedmoveLog[-1] += '+'
-                                elif gs.checkmate:
-                                    notatedmoveLog[-1] += '#'
-                                elif gs.stalemate:
-                                    notatedmoveLog[-1] += '='
-                                notatedmoveLog.append(move.getChessNotation())
-                                print(notatedmoveLog)
-                                gs.makeMove(validMoves[i])
-                                moveMade = True
-                                sqselected = () #deselect after move
-                                playerClicks = [] #reset clicks  
-                                drawMoveLog(screen, notatedmoveLog, moveLogFont)
-
-                        if not moveMade:
-                            playerClicks = [sqselected]
+                        if sqselected == (row,col) or col >= 8: #if click, select, if its the same square, deselect
+                            sqselected = () #deselect, empty
+                            playerClicks = []
+                        else:
+                            sqselected = (row, col)
+                            playerClicks.append(sqselected) 
+                        if len(playerClicks) == 2: #this is the second click
+                            move = chessengine.Move(playerClicks[0], playerClicks[1], gs.board)
+                            #a promotion matches four valid moves, one per piece - the picker asks which
+                            choices = [validMove for validMove in validMoves if validMove.moveID == move.moveID]
+                            if len(choices) > 1:
+                                promotionChoices = choices
+                            elif choices:
+                                chosenMove = choices[0]
+                            else:
+                                playerClicks = [sqselected]
+
+                    if chosenMove is not None:
+                        notatedmoveLog.append(chessengine.moveToSan(gs, chosenMove.getCode()))
+                        print(notatedmoveLog)
+                        gs.makeMove(chosenMove)
+                        pressClock(gameClock, gs)
+                        moveMade = True
+                        if ponderer is not None:
+                            if gs.moveLog[-1].getCode() == ponderer.ponderMove:
+                                ponderer.ponderHit(botTimeLimits(gameClock, gs))
+                                thinker = ponderer
+                            else:
+                                cancelThinking(ponderer)
+                            ponderer = None
+                        sqselected = () #deselect after move
+                        playerClicks = [] #reset clicks  
 
             elif event.type == pg.KEYDOWN:
                 if event.key == pg.K_u: #undo when U is pressed
+                    promotionChoices = []
+                    thinker = cancelThinking(thinker)
+                    ponderer = cancelThinking(ponderer)
                     gs.undoMove()
+                    restartClock(gameClock, gs)
                     gameOver = False
                     if len(notatedmoveLog)>0:
                         notatedmoveLog.pop()
-                    drawMoveLog(screen, notatedmoveLog, moveLogFont)
                     moveMade = True
 
                 if event.key == pg.K_r:  # reset the game when 'r' is pressed
+                    promotionChoices = []
+                    thinker = cancelThinking(thinker)
+                    ponderer = cancelThinking(ponderer)
+                    evalCache.clear()
+                    gameClock = newClock()
                     gs = chessengine.GameState()
                     validMoves = gs.getValidMoves()
                     sqselected = ()
                     playerClicks = []
                     moveMade = False
                     gameOver = False
-                    if len(notatedmoveLog)>0:
-                        notatedmoveLog.clear()
-                        drawMoveLog(screen, notatedmoveLog, moveLogFont)
+                    status = "White to move"
+                    notatedmoveLog.clear()
+
+                if event.key == pg.K_p: #save the game as PGN
+                    saveGame(gs, status if gameOver else None, playerOne, playerTwo)
+
+                if event.key == pg.K_l: #load the last saved game and play on from where it stopped
+                    loaded = loadLastGame()
+                    if loaded is not None:
+                        promotionChoices = []
+                        thinker = cancelThinking(thinker)
+                        ponderer = cancelThinking(ponderer)
+                        evalCache.clear()
+                        gameClock = newClock()
+                        gs, notatedmoveLog[:] = loaded
+                        sqselected = ()
+                        playerClicks = []
+                        moveMade = True
+                        gameOver = False
                 
-        #AI move finder logic
+        #AI move finder logic - the search runs on a thread, the loop only checks if it is done
         if not gameOver and not isHumanTurn:
-            aimove = chessai.findBestMove(gs, validMoves)
-            if aimove == None:
-                aimove = chessai.findRandomMove #just a backup - in lost positions they will resort to random play
-            gs.makeMove(aimove)
-            notatedmoveLog.append(aimove.getChessNotation())
-            print(notatedmoveLog)
-            moveMade = True
+            if thinker is None:
+                thinker = BotThinker(gs, validMoves, evalCache, book, tablebases, botTimeLimits(gameClock, gs))
+            elif thinker.isDone():
+                aimove = thinker.move
+                line = thinker.info.pv
+                thinker = None
+                if aimove == None:
+                    aimove = chessai.findRandomMove(validMoves) #just a backup - in lost positions they will resort to random play
+                notatedmoveLog.append(chessengine.moveToSan(gs, aimove.getCode()))
+                gs.makeMove(aimove)
+                pressClock(gameClock, gs)
+                print(notatedmoveLog)
+                moveMade = True
+                if botPonder and len(line) > 1 and line[0] == aimove.getCode():
+                    ponderMove = line[1]
             
 
         if moveMade:   
             # animateMove(gs.moveLog[-1], screen, gs.board, clock)
-            if gs.whiteToMove:
-                resetText(screen,'Black to move')
-                resetText(screen,'Black wins by checkmate')
-                resetText(screen,'White wins by checkmate')
-                drawEndGameText(screen, "White to move")
-                drawMoveLog(screen, notatedmoveLog, moveLogFont)
-
-            else:
-                resetText(screen, 'White to move')
-                resetText(screen,'Black wins by checkmate')
-                resetText(screen,'White wins by checkmate')                
-                
-                drawEndGameText(screen, "Black to move")
-                drawMoveLog(screen, notatedmoveLog, moveLogFont)
-
+            status = "White to move" if gs.whiteToMove else "Black to move"
             validMoves = gs.getValidMoves()
             moveMade = False
-        
 
-        drawGameState(screen, gs, validMoves, sqselected)
-        drawUndo(screen, btnFont)
-        drawReset(screen, btnFont)
-        drawResign(screen, btnFont)
-        drawDraw(screen, btnFont)
-    
+        if ponderMove is not None:
+            #not after a move that ended the game - mate, stalemate or a draw by rule
+            if validMoves and gs.drawReason is None:
+                ponderer = BotThinker(gs, None, evalCache, book, tablebases, None, ponderMove=ponderMove)
+            ponderMove = None
 
-        if not gameOver:
-            drawMoveLog(screen, notatedmoveLog, moveLogFont)
-            
-        if gs.checkmate:
+        if not gameOver and gameClock is not None and gameClock.flagged(gs.whiteToMove):
+            thinker = cancelThinking(thinker)
+            ponderer = cancelThinking(ponderer)
             gameOver = True
-            if gs.whiteToMove:
-                resetText(screen, 'White to move')
-                drawEndGameText(screen, "Black wins by checkmate")
-                drawMoveLog(screen, notatedmoveLog, moveLogFont)
-            else:
-                resetText(screen,'Black to move')
-                drawEndGameText(screen, "White wins by checkmate")
-                drawMoveLog(screen, notatedmoveLog, moveLogFont)
+            stopClock(gameClock)
+            status = "Black wins on time" if gs.whiteToMove else "White wins on time"
+        elif gs.checkmate:
+            thinker = cancelThinking(thinker)
+            ponderer = cancelThinking(ponderer)
+            gameOver = True
+            stopClock(gameClock)
+            status = "Black wins by checkmate" if gs.whiteToMove else "White wins by checkmate"
         elif gs.stalemate:
+            thinker = cancelThinking(thinker)
+            ponderer = cancelThinking(ponderer)
+            gameOver = True
+            stopClock(gameClock)
+            status = "Draw by Position"
+        elif gs.drawReason is not None:
+            thinker = cancelThinking(thinker)
+            ponderer = cancelThinking(ponderer)
             gameOver = True
-            resetText(screen,'Black to move')
-            resetText(screen, 'White to move')
-            drawEndGameText(screen, "Draw by Position")
-            drawMoveLog(screen, notatedmoveLog, moveLogFont)
+            stopClock(gameClock)
+            status = "Draw by " + gs.drawReason
+
+        #only what changed since the last frame is drawn and sent to the display
+        renderer.drawBoard(gs, validMoves, sqselected, promotionChoices if not gameOver else [])
+        renderer.drawButtons()
+        renderer.drawStatus(status)
+        renderer.drawMoveLog(notatedmoveLog)
+        renderer.drawThinking(thinkingText(thinker, ponderer))
+        renderer.drawClocks(clockText(gameClock))
 
         clock.tick(maxFps)
-        pg.display.flip()
+        renderer.update()
 
+    cancelThinking(thinker)
+    cancelThinking(ponderer)
+    if book is not None:
+        book.close()
+    if tablebases is not None:
+        tablebases.close()
 
 
-#highlight possible squares in each move 
 
-def highlightSquares(screen, gs, validMoves, sqselected):
-    if sqselected != ():
-        r, c = sqselected
-        #if white to move, compare 'w' to the color of the board piece, else compare black
-        # Check that the selected square is of a piece you can move 
-
-        if gs.whiteToMove:
-            if gs.board[r][c][0] == 'w': 
-            # a pygame surface is an image you can impose on the screen
-                s = pg.Surface((squareSize, squareSize))
-                s.fill(selectedColor)
-                screen.blit(s, (c*squareSize, r*squareSize)) #highlight the selected square yellow
-                
-                #highlight destination squares
-                s.set_alpha(70) #  a transparency value, only for the black
-                s.fill(pg.Color('black'))
-                for move in validMoves:
-                    if move.startRow == r and move.startCol == c: #if the starting coords are requal to the starting square
-                        screen.blit(s, (squareSize*move.endCol, squareSize*move.endRow))
-        elif not gs.whiteToMove:
-            if gs.board[r][c][0] == 'b': 
-            # a pygame surface is an image you can impose on the screen
-                s = pg.Surface((squareSize, squareSize))
-                s.fill(selectedColor)
-                screen.blit(s, (c*squareSize, r*squareSize)) #highlight the selected square yellow
-                
-                #highlight destination squares
-                s.set_alpha(70) #  a transparency value, only for the black
-                s.fill(pg.Color('black'))
-                for move in validMoves:
-                    if move.startRow == r and move.startCol == c: #if the starting coords are requal to the starting square
-                        screen.blit(s, (squareSize*move.endCol, squareSize*move.endRow))
-
-#keeps updating, draws out the board and the pieces with pygame
-def drawGameState(screen, gs, validMoves, sqselected):
-    drawBoard(screen)
-    #piece highlighting
-    highlightSquares(screen, gs, validMoves, sqselected)
-    drawPieces(screen, gs.board) #board from the chessengine file GS class. 2d arr
-
-def drawBoard(screen):
-    global colors
-    #black and white is unpleasant - this is lichess theme
-    colors = [lSquare, dSquare]  
-    for r in range(dimension):
-        for c in range(dimension):
-            #diagnose color by row/column - evem yields light while odd dark
-            color = colors[(r+c)%2] 
-            '''
-            params listed: surface, diagnosed color,rect object containing xval, yval and dimensions.
-            the x and y val are squareSize*r/Squaresize*c +boardx/y
-            the Squares are 'printed' one by one with the position of squaresize*r/c as r/c keeps going up with loop
-            thus the square position are right next to the other squares, creating the illusion of a board
-            the boardx/y is to center the squares in the display of 600x960 px
-            '''
-            pg.draw.rect(screen, color, pg.Rect(squareSize*c, squareSize*r, squareSize, squareSize))
-
-
-
-#draw pieces based on current GS
-def drawPieces(screen, board): #board from gamestate class from chessengine
-    for r in range(dimension):
-        for c in range(dimension):
-            piece = board[r][c]
-            if piece != "--":#not empty
-                '''
-                https://www.pygame.org/docs/ref/surface.html?highlight=blit#pygame.Surface.
-                BLIT is for placing images on a surface. The used params are (source, destination)
-                source is from the images array which holds paths to the chess piece icon PNGs
-                the destination can be coordinates or a rect value where the dimensions don't matter, 
-                just the positions, but they need to be there to be a rect obj
-                boardx is needed for the offset to center the piece.
-                '''
-                screen.blit(images[piece], pg.Rect(squareSize*c, r*squareSize, squareSize, squareSize))
+'''
+Bot thinking
+The search runs on a thread against a copy of the position, so the window keeps drawing
+and handling events while the bot thinks. The move comes back through a queue.
+
+Pondering: after the bot moves, the second move of its best line is the reply it expects.
+A pondering BotThinker plays that reply on its copy and searches on, with no deadline,
+while the human thinks. If the human plays it (a ponder hit) the search keeps going and
+gets a deadline, and its transposition table entries are already warm. Any other move
+cancels it and a normal search starts.
+'''
+class BotThinker():
+    def __init__(self, gs, validMoves, evalCache, book, tablebases, timeLimits, ponderMove=None):
+        self.info = chessai.SearchInfo() #depth and nodes for the indicator, and the stop flag
+        self.evalCache = evalCache
+        self.book = book
+        self.tablebases = tablebases
+        self.timeLimits = timeLimits #(soft, hard) seconds of botTimeLimits, None while pondering
+        self.results = queue.Queue()
+        self.move = None
+        self.ponderMove = ponderMove #packed move the ponder search expects the human to play
+        self.startTime = time.time()
+        position = chessengine.GameState.fromSnapshot(gs.getSnapshot())
+        if ponderMove is not None:
+            position.pushMove(ponderMove)
+            validMoves = position.getValidMoves()
+        self.thread = threading.Thread(target=self.run, args=(position, validMoves), daemon=True)
+        self.thread.start()
+
+    def run(self, position, validMoves):
+        if self.ponderMove is not None: #searches until stopped or given a deadline by ponderHit
+            move = chessai.findBestMove(position, validMoves, depth=chessai.MAX_DEPTH, info=self.info,
+                                        evalCache=self.evalCache, book=self.book, tablebases=self.tablebases)
+        else:
+            softTime, hardTime = self.timeLimits
+            move = chessai.findBestMove(position, validMoves, moveTime=hardTime, softTime=softTime, workers=botWorkers, info=self.info,
+                                        evalCache=self.evalCache, book=self.book, tablebases=self.tablebases)
+        self.results.put(move)
+
+    def ponderHit(self, timeLimits):
+        softTime, hardTime = timeLimits
+        now = time.time()
+        if softTime is None: #the time already pondered counts, the bot never takes longer to answer than without pondering
+            self.info.deadline = min(now + hardTime, max(now, self.startTime + 2*hardTime))
+        else: #the pondered time counts towards the soft limit, only the hard one is new
+            self.info.startTime = self.startTime
+            self.info.softTime = softTime
+            self.info.deadline = now + hardTime
+
+    def isDone(self):
+        try:
+            self.move = self.results.get_nowait()
+            return True
+        except queue.Empty:
+            return False
+
+    def cancel(self):
+        self.info.stop()
+
+def cancelThinking(thinker):
+    #stops a running search, its move is never played. Returns None to clear the caller's thinker
+    if thinker is not None:
+        thinker.cancel()
+    return None
+
+'''
+Clock
+gameClock is a chessclock.Clock, or None when the game has no time control - the helpers
+take either, so the game loop doesn't have to check.
+'''
+def newClock():
+    if gameTimeControl is None:
+        return None
+    return chessclock.Clock(chessclock.TIME_CONTROLS[gameTimeControl], gameIncrement)
+
+def pressClock(gameClock, gs):
+    #called right after a move is made, the side that moved is the one not to move
+    if gameClock is not None:
+        gameClock.press(not gs.whiteToMove)
+
+def restartClock(gameClock, gs):
+    #after an undo the side to move runs its time again, without the increment back
+    if gameClock is not None and gameClock.running is not None:
+        gameClock.start(gs.whiteToMove)
+
+def stopClock(gameClock):
+    if gameClock is not None:
+        gameClock.stop()
+
+def botTimeLimits(gameClock, gs):
+    #(soft, hard) seconds for the bot's move - from its clock, or botMoveTime per move without one
+    if gameClock is None:
+        return None, botMoveTime
+    return chessclock.allocateTime(gameClock.timeLeft(gs.whiteToMove), gameClock.increment, ply=len(gs.moveLog))
 
 '''
-Undo Button
+Saving games
+P appends the game to gamePgnPath and L loads the last game of that file back onto the board.
+chesspgn streams through the file, so only one game of it is in memory at a time.
 '''
-def drawUndo(screen, font):
-    pg.draw.rect(screen, undoAzure, undoBtnRect)
-    text_object = font.render("Undo 'U'", True, pg.Color('white'))
-    text_location = undoBtnRect.move((btnWidth-text_object.get_width())/2, (btnHeight-text_object.get_height())/2)
-    screen.blit(text_object, text_location)
+def gameResult(status):
+    #PGN result of the end of game text, None while the game goes on
+    if status is None:
+        return '*'
+    if status.startswith('White wins'):
+        return '1-0'
+    if status.startswith('Black wins'):
+        return '0-1'
+    return '1/2-1/2'
+
+def saveGame(gs, status, playerOne, playerTwo):
+    headers = {'Event': 'chessbot game', 'Date': time.strftime('%Y.%m.%d'),
+               'White': 'Human' if playerOne else 'chessbot', 'Black': 'Human' if playerTwo else 'chessbot'}
+    game = chesspgn.gameFromState(gs, headers, gameResult(status), status)
+    with open(gamePgnPath, 'a') as f:
+        chesspgn.writeGame(f, game)
+    print('game saved to ' + gamePgnPath)
+
+def loadLastGame():
+    #(GameState, move log) of the last game in gamePgnPath, or None
+    if not os.path.isfile(gamePgnPath):
+        return None
+    last = None
+    with open(gamePgnPath) as f:
+        for game in chesspgn.readGames(f):
+            last = game
+    if last is None or last.position is None: #nothing saved, or a broken FEN
+        return None
+    if last.error is not None:
+        print(gamePgnPath + ': ' + last.error + ', loaded up to there')
+    #played again with makeMove, so the moves can be undone
+    gs = chessengine.GameState.fromFen(last.startFen())
+    moveLog = []
+    for code in last.moves:
+        moveLog.append(chessengine.moveToSan(gs, code))
+        gs.makeMove(chessai.moveFromCode(gs.getValidMoves(), code))
+    return gs, moveLog
+
+def clockText(gameClock):
+    if gameClock is None:
+        return ''
+    return 'White ' + chessclock.formatTime(gameClock.timeLeft(True)) + '    Black ' + chessclock.formatTime(gameClock.timeLeft(False))
+
+def thinkingText(thinker, ponderer):
+    if thinker is not None:
+        return 'Thinking... depth ' + str(thinker.info.depth) + '  ' + str(thinker.info.nodes) + ' nodes  cache ' + str(int(100*thinker.evalCache.stats()['hitRate'])) + '%'
+    if ponderer is not None:
+        return 'Pondering ' + chessengine.moveToUci(ponderer.ponderMove) + '... depth ' + str(ponderer.info.depth)
+    return ''
 
 '''
-Reset Button
+Promotion picker
+Drawn over the board on the promotion file, the queen on the promotion square and the
+rook, bishop and knight below it (above it for black). The game loop keeps running while
+it is open - the next click either picks a piece or closes it.
 '''
-def drawReset(screen, font):
-    pg.draw.rect(screen, resetSangria, resetBtnRect)
-    text_object = font.render("Reset 'R'", True, pg.Color('white'))
-    text_location = resetBtnRect.move((btnWidth-text_object.get_width())/2, (btnHeight-text_object.get_height())/2)
-    screen.blit(text_object, text_location)
-
-def drawResign(screen, font):
-    pg.draw.rect(screen, pg.Color('black'), resignBtnRect)
-    text_object = font.render("Resign", True, pg.Color('white'))
-    text_location = resignBtnRect.move((btnWidth-text_object.get_width())/2, (btnHeight-text_object.get_height())/2)
-    screen.blit(text_object, text_location)
-
-def drawDraw(screen, font):
-    pg.draw.rect(screen, dSquare, drawBtnRect)
-    text_object = font.render("Draw", True, lSquare)
-    text_location = drawBtnRect.move((btnWidth-text_object.get_width())/2, (btnHeight-text_object.get_height())/2)
-    screen.blit(text_object, text_location)
-
-
-'''Draw movelog'''
-
-def drawMoveLog(screen, moveLog, font):
-    moveLogRect = pg.Rect(sheight + moveLogMargin, sheight/6, moveLogPanelWidth, moveLogPanelHeight)
-    pg.draw.rect(screen, pg.Color('black'), moveLogRect)
-    moveTexts = []
-
-    for i in range(0, len(moveLog), 2):
-        move_string = str(i // 2 + 1) + '. ' + str(moveLog[i]) + "  "
-        if i + 1 < len(moveLog):
-            move_string += str(moveLog[i + 1]) + "   "
-        moveTexts.append(move_string)
-        # print(moveTexts)
-
-    moves_per_row = 3
-    padding = 20
-    line_spacing = 2
-    text_y = padding
-    for i in range(0, len(moveTexts), moves_per_row):
-        text = ""
-        for j in range(moves_per_row):
-            if i + j < len(moveTexts):
-                text += moveTexts[i + j] + ' '
-
-        text_object = font.render(text, True, pg.Color('white'))
-        text_location = moveLogRect.move(padding, text_y)
-        screen.blit(text_object, text_location)
-        text_y += text_object.get_height() + line_spacing
+promotionOrder = ['Q', 'R', 'B', 'N']
+
+def promotionSquares(choices):
+    #(row, col) of every piece of the picker, in promotionOrder
+    move = choices[0]
+    step = 1 if move.endRow == 0 else -1
+    return [(move.endRow + i*step, move.endCol) for i in range(len(promotionOrder))]
+
+def pickPromotion(mouseloc, choices):
+    #the promotion move whose piece was clicked, None for a click outside the picker
+    clicked = (mouseloc[1]//squareSize, mouseloc[0]//squareSize)
+    for piece, square in zip(promotionOrder, promotionSquares(choices)):
+        if clicked == square:
+            for move in choices:
+                if move.promotionPiece == piece:
+                    return move
+    return None
 
 '''
-Draw end of game text
+Fonts and text
+Fonts are opened once per size. Rendered text is kept in textCache, so a label or move log
+line that doesn't change is rendered once - the cache starts over when it gets full.
 '''
-def drawEndGameText(screen, text):
-    font = pg.font.Font("FontsFree-Net-SFProDisplay-Regular (2).ttf", 30)
-    text_object = font.render(text, False, pg.Color("black"))
-    text_location = pg.Rect(0, 0, sheight, sheight).move((sheight+swidth)/2 - text_object.get_width() / 2,
-                                                                 sheight / 10 - text_object.get_height() / 2)
-    screen.blit(text_object, text_location)
-
-def resetText(screen, text):
-    font = pg.font.Font("FontsFree-Net-SFProDisplay-Regular (2).ttf", 30)
-    text_object = font.render(text, False, pg.Color("white"))
-    text_location = pg.Rect(0, 0, sheight, sheight).move((sheight+swidth)/2 - text_object.get_width() / 2,
-                                                                 sheight / 10 - text_object.get_height() / 2)
-    screen.blit(text_object, text_location)
+endGameFontPath = "FontsFree-Net-SFProDisplay-Regular (2).ttf"
+moveLogFontPath = "Product Sans Regular.ttf"
+TEXT_CACHE_SIZE = 512 #rendered texts kept
+
+fontCache = {}
+textCache = {}
+
+def getFont(path, size):
+    font = fontCache.get((path, size))
+    if font is None:
+        font = fontCache[(path, size)] = pg.font.Font(path, size)
+    return font
+
+def renderText(font, text, colour, antialias=True):
+    key = (font, text, tuple(colour), antialias)
+    surface = textCache.get(key)
+    if surface is None:
+        if len(textCache) >= TEXT_CACHE_SIZE:
+            textCache.clear()
+        surface = textCache[key] = font.render(text, antialias, colour)
+    return surface
 
+'''
+Rendering
+Renderer remembers what every square and panel shows and only draws what changed since the
+last frame - a move redraws its squares, a tick of the clock only the clock. The changed areas
+go to pg.display.update, so an idle frame costs next to nothing and the bot's search keeps
+the CPU. The empty board is drawn once onto boardSurface and squares are copied from it.
+'''
+statusRect = pg.Rect(sheight, 0, swidth - sheight, sheight/6)
+moveLogRect = pg.Rect(sheight + moveLogMargin, sheight/6, moveLogPanelWidth, moveLogPanelHeight)
+thinkingRect = pg.Rect(sheight + moveLogMargin, sheight/6 + moveLogPanelHeight + 10, moveLogPanelWidth, 20)
+clockRect = pg.Rect(sheight + moveLogMargin, sheight/6 + moveLogPanelHeight + 40, moveLogPanelWidth, 40)
+#rect, colour, label and label colour of every button
+buttons = [
+    (undoBtnRect, undoAzure, "Undo 'U'", white),
+    (resetBtnRect, resetSangria, "Reset 'R'", white),
+    (resignBtnRect, black, "Resign", white),
+    (drawBtnRect, dSquare, "Draw", lSquare),
+]
+
+class Renderer():
+    def __init__(self, screen):
+        self.screen = screen
+        #black and white is unpleasant - this is lichess theme
+        colors = [lSquare, dSquare]
+        self.boardSurface = pg.Surface((dimension*squareSize, dimension*squareSize))
+        for r in range(dimension):
+            for c in range(dimension):
+                #even row + col is light, odd dark
+                pg.draw.rect(self.boardSurface, colors[(r+c)%2], pg.Rect(squareSize*c, squareSize*r, squareSize, squareSize))
+        self.selectedSurface = pg.Surface((squareSize, squareSize))
+        self.selectedSurface.fill(selectedColor)
+        self.targetSurface = pg.Surface((squareSize, squareSize))
+        self.targetSurface.set_alpha(70) #a transparency value, only for the black
+        self.targetSurface.fill(black)
+        self.squares = [[None]*dimension for _ in range(dimension)] #(piece, mark) shown on every square
+        self.panels = {} #panel name -> the content it shows
+        self.dirty = [] #rects changed since the last update
+        self.fullUpdate = True #the first frame goes to the display whole
+
+    def update(self):
+        #sends the changed areas to the display
+        if self.fullUpdate:
+            pg.display.flip()
+            self.fullUpdate = False
+        elif self.dirty:
+            pg.display.update(self.dirty)
+        self.dirty = []
+
+    def drawBoard(self, gs, validMoves, sqselected, promotionChoices):
+        marks = highlightMarks(gs, validMoves, sqselected)
+        picker = {}
+        if promotionChoices:
+            colour = promotionChoices[0].pieceMoved[0]
+            for piece, square in zip(promotionOrder, promotionSquares(promotionChoices)):
+                picker[square] = colour + piece
+        for r in range(dimension):
+            for c in range(dimension):
+                if (r, c) in picker:
+                    content = (picker[(r, c)], 'picker')
+                else:
+                    content = (gs.board[r][c], marks.get((r, c)))
+                if self.squares[r][c] != content:
+                    self.squares[r][c] = content
+                    self.drawSquare(r, c, *content)
+
+    def drawSquare(self, r, c, piece, mark):
+        square = pg.Rect(squareSize*c, squareSize*r, squareSize, squareSize)
+        if mark == 'picker':
+            pg.draw.rect(self.screen, white, square)
+            pg.draw.rect(self.screen, selectedColor, square, 3)
+        else:
+            self.screen.blit(self.boardSurface, square, square)
+            if mark == 'selected':
+                self.screen.blit(self.selectedSurface, square)
+            elif mark == 'target':
+                self.screen.blit(self.targetSurface, square)
+        if piece != "--":
+            self.screen.blit(images[piece], square)
+        self.dirty.append(square)
+
+    def changed(self, name, content):
+        #True when the panel has to be redrawn to show content
+        if name in self.panels and self.panels[name] == content:
+            return False
+        self.panels[name] = content
+        return True
+
+    def drawButtons(self):
+        if not self.changed('buttons', None):
+            return
+        font = getFont(endGameFontPath, 25)
+        for rect, colour, label, labelColour in buttons:
+            pg.draw.rect(self.screen, colour, rect)
+            text_object = renderText(font, label, labelColour)
+            self.screen.blit(text_object, rect.move((btnWidth-text_object.get_width())/2, (btnHeight-text_object.get_height())/2))
+            self.dirty.append(rect)
+
+    def drawStatus(self, text):
+        if not self.changed('status', text):
+            return
+        pg.draw.rect(self.screen, white, statusRect)
+        text_object = renderText(getFont(endGameFontPath, 30), text, black, False)
+        self.screen.blit(text_object, ((sheight+swidth)/2 - text_object.get_width() / 2, sheight / 10 - text_object.get_height() / 2))
+        self.dirty.append(statusRect)
+
+    def drawMoveLog(self, moveLog):
+        if not self.changed('moveLog', tuple(moveLog)):
+            return
+        pg.draw.rect(self.screen, black, moveLogRect)
+        font = getFont(moveLogFontPath, 12)
+        moveTexts = []
+        for i in range(0, len(moveLog), 2):
+            move_string = str(i // 2 + 1) + '. ' + str(moveLog[i]) + "  "
+            if i + 1 < len(moveLog):
+                move_string += str(moveLog[i + 1]) + "   "
+            moveTexts.append(move_string)
+
+        moves_per_row = 3
+        padding = 20
+        line_spacing = 2
+        text_y = padding
+        for i in range(0, len(moveTexts), moves_per_row):
+            text = ' '.join(moveTexts[i:i + moves_per_row]) + ' '
+            text_object = renderText(font, text, white)
+            self.screen.blit(text_object, moveLogRect.move(padding, text_y))
+            text_y += text_object.get_height() + line_spacing
+        self.dirty.append(moveLogRect)
+
+    def drawThinking(self, text):
+        if not self.changed('thinking', text):
+            return
+        pg.draw.rect(self.screen, white, thinkingRect)
+        if text:
+            self.screen.blit(renderText(getFont(moveLogFontPath, 12), text, black), thinkingRect)
+        self.dirty.append(thinkingRect)
+
+    def drawClocks(self, text):
+        if not self.changed('clocks', text):
+            return
+        pg.draw.rect(self.screen, white, clockRect)
+        if text:
+            self.screen.blit(renderText(getFont(endGameFontPath, 25), text, black), clockRect)
+        self.dirty.append(clockRect)
+
+#highlight possible squares in each move
+def highlightMarks(gs, validMoves, sqselected):
+    #(row, col) -> 'selected' or 'target' for the selected piece and the squares it can move to
+    marks = {}
+    if sqselected != ():
+        r, c = sqselected
+        # Check that the selected square is of a piece you can move
+        if gs.board[r][c][0] == ('w' if gs.whiteToMove else 'b'):
+            marks[(r, c)] = 'selected'
+            for move in validMoves:
+                if move.startRow == r and move.startCol == c:
+                    marks[(move.endRow, move.endCol)] = 'target'
+    return marks
 
 
 '''
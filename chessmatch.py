@@ -0,0 +1,394 @@
+'''
+Self-play matches - plays two chessai configurations against each other without the window,
+to measure whether a change makes the bot stronger. Games run in parallel, one per process.
+
+python chessmatch.py -e new DELTA_MARGIN=150 -e base --each nodes=20000 -g 1000
+python chessmatch.py -e new tc=10+0.1 -e base tc=10+0.1 --openings openings.epd -c 8 --pgn games.pgn
+python chessmatch.py -e new -e base --each st=0.1 --sprt 0 5
+
+An engine is a name and key=value options, --each sets options for both:
+  depth=N       search depth per move
+  nodes=N       nodes per move - the same search on any machine, and the fastest way to play many games
+  st=S          seconds per move
+  tc=B+I        a clock of B seconds per game with an increment of I seconds, time is lost on the flag
+  book=PATH     Polyglot opening book
+  NAME=VALUE    a chessai constant for this engine only, e.g. DELTA_MARGIN=150 or INSTABILITY_WEIGHT=0.5
+Both engines of a game live in the same process, so each has its own transposition and pawn tables
+and evaluation cache, and its constants are put into chessai only while it searches.
+
+Every opening (FEN or EPD lines, the start position without a file) is played twice, once with
+each engine as white. Games are adjudicated as well as played out - see Adjudication.
+The results are given as the Elo difference of the first engine with a 95% error bar and the
+likelihood of superiority. With --sprt the match stops as soon as the sequential probability
+ratio test decides between elo0 (the change is no better) and elo1 (it gains that much).
+'''
+import argparse
+import concurrent.futures
+import math
+import random
+import sys
+import time
+
+import chessai
+import chessbook
+import chessclock
+import chessengine
+import chesspgn
+import chesstablebase
+
+'''
+Engines
+'''
+LIMITS = ('depth', 'nodes', 'st', 'tc')
+
+def parseEngine(tokens, each=()):
+    #{'name': ..., option: value} of the tokens after -e, the --each options first
+    config = {'name': tokens[0], 'overrides': {}}
+    for token in list(each) + tokens[1:]:
+        if '=' not in token:
+            raise ValueError('engine option ' + token + ' is not key=value')
+        key, value = token.split('=', 1)
+        if key in ('depth', 'nodes'):
+            config[key] = int(value)
+        elif key == 'st':
+            config[key] = float(value)
+        elif key == 'tc':
+            base, _, increment = value.partition('+')
+            config[key] = (float(base), float(increment or 0))
+        elif key == 'book':
+            config[key] = value
+        elif key.isupper() and isinstance(getattr(chessai, key, None), (int, float)):
+            config['overrides'][key] = type(getattr(chessai, key))(value)
+        else:
+            raise ValueError('unknown engine option ' + key)
+    if not any(limit in config for limit in LIMITS):
+        config['depth'] = chessai.DEPTH
+    return config
+
+class Player():
+    #one engine in one game, with search tables of its own
+    def __init__(self, config, tablebases):
+        self.config = config
+        self.name = config['name']
+        self.overrides = config['overrides']
+        self.book = chessbook.openBook(config['book']) if 'book' in config else None
+        self.tablebases = tablebases
+        self.transpositionTable = chessai.TranspositionTable()
+        self.pawnTable = chessai.PawnTable()
+        self.evalCache = chessai.EvalCache()
+        self.clock = chessclock.Clock(config['tc'][0] / 60, config['tc'][1]) if 'tc' in config else None
+
+    def search(self, gs, validMoves, seed):
+        '''
+        (move, score) for the side to move. score is from its point of view, None when the move
+        came from the book or the tables.
+        '''
+        config = self.config
+        info = chessai.SearchInfo()
+        scores = []
+        info.report = lambda info, score: scores.append(score)
+        softTime = hardTime = None
+        if self.clock is not None:
+            softTime, hardTime = chessclock.allocateTime(self.clock.timeLeft(gs.whiteToMove), self.clock.increment,
+                                                         ply=2*(gs.fullmoveNumber - 1) + (0 if gs.whiteToMove else 1))
+        elif 'st' in config:
+            hardTime = config['st']
+
+        #chessai keeps its tables and constants in module globals, this engine's go in for the search
+        saved = {name: getattr(chessai, name) for name in self.overrides}
+        saved['transpositionTable'] = chessai.transpositionTable
+        saved['pawnTable'] = chessai.pawnTable
+        for name, value in self.overrides.items():
+            setattr(chessai, name, value)
+        chessai.transpositionTable = self.transpositionTable
+        chessai.pawnTable = self.pawnTable
+        try:
+            move = chessai.findBestMove(gs, validMoves, depth=config.get('depth'), moveTime=hardTime, softTime=softTime,
+                                        nodes=config.get('nodes'), workers=1, seed=seed, info=info,
+                                        evalCache=self.evalCache, book=self.book, tablebases=self.tablebases)
+        finally:
+            for name, value in saved.items():
+                setattr(chessai, name, value)
+        return move, scores[-1] if scores else None
+
+    def close(self):
+        if self.book is not None:
+            self.book.close()
+
+'''
+Adjudication
+A game is decided without playing it out when
+  - the tablebases have the position (the result is exact),
+  - both engines have scored it beyond RESIGN_SCORE for the same side for RESIGN_MOVES moves each,
+  - after DRAW_MOVE_NUMBER both engines have scored it within DRAW_SCORE for DRAW_MOVES moves each,
+  - it reaches MAX_PLIES.
+Scores count only when both engines agree, so one engine's blunder in its evaluation can't end a game.
+'''
+RESIGN_SCORE = 800 #centipawns
+RESIGN_MOVES = 3
+DRAW_SCORE = 10
+DRAW_MOVES = 8
+DRAW_MOVE_NUMBER = 40
+MAX_PLIES = 400
+
+def adjudicate(scores, gs):
+    '''
+    (result, reason) once the scores of the game so far - from white's point of view, one per
+    ply, None for book and table moves - decide it, else None.
+    '''
+    recent = scores[-2*RESIGN_MOVES:]
+    if len(recent) == 2*RESIGN_MOVES and None not in recent:
+        if all(score >= RESIGN_SCORE for score in recent):
+            return '1-0', 'black resigns'
+        if all(score <= -RESIGN_SCORE for score in recent):
+            return '0-1', 'white resigns'
+    recent = scores[-2*DRAW_MOVES:]
+    if gs.fullmoveNumber > DRAW_MOVE_NUMBER and len(recent) == 2*DRAW_MOVES and None not in recent:
+        if all(abs(score) <= DRAW_SCORE for score in recent):
+            return '1/2-1/2', 'draw adjudication'
+    return None
+
+def tablebaseResult(gs, tablebases):
+    #(result, reason) when the position is in the tables, else None
+    if tablebases is None:
+        return None
+    probe = tablebases.probe(gs)
+    if probe is None:
+        return None
+    outcome = probe[0]
+    if outcome == chesstablebase.DRAW:
+        return '1/2-1/2', 'tablebase draw'
+    whiteWins = (outcome == chesstablebase.WIN) == gs.whiteToMove
+    return ('1-0' if whiteWins else '0-1'), 'tablebase win'
+
+'''
+Games
+Every worker process opens the tablebases once, in its initializer, and plays whole games.
+A game comes back as a dict with everything the PGN and the score need.
+'''
+_tablebases = None
+
+def initWorker(tablebasePath):
+    global _tablebases
+    _tablebases = chesstablebase.openTablebases(tablebasePath)
+
+def playGame(number, whiteConfig, blackConfig, fen, seed):
+    gs = chessengine.GameState.fromFen(fen)
+    players = [Player(whiteConfig, _tablebases), Player(blackConfig, _tablebases)] #white, black
+    rng = random.Random(seed)
+    moves = []
+    scores = [] #white's point of view
+    result = termination = None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if gs.checkmate:
+            result, reason = ('0-1' if gs.whiteToMove else '1-0'), 'checkmate'
+            break
+        if gs.stalemate:
+            result, reason = '1/2-1/2', 'stalemate'
+            break
+        if gs.drawReason is not None:
+            result, reason = '1/2-1/2', gs.drawReason
+            break
+        decided = tablebaseResult(gs, _tablebases) or adjudicate(scores, gs)
+        if decided is None and len(moves) >= MAX_PLIES:
+            decided = '1/2-1/2', 'move limit'
+        if decided is not None:
+            (result, reason), termination = decided, 'adjudication'
+            break
+
+        player = players[0 if gs.whiteToMove else 1]
+        if player.clock is not None:
+            player.clock.start(gs.whiteToMove)
+        move, score = player.search(gs, validMoves, rng.getrandbits(32))
+        if player.clock is not None: #each engine has a clock of its own, it only runs during its searches
+            if player.clock.flagged(gs.whiteToMove):
+                result = '0-1' if gs.whiteToMove else '1-0'
+                reason, termination = ('white' if gs.whiteToMove else 'black') + ' loses on time', 'time forfeit'
+                break
+            player.clock.press(gs.whiteToMove)
+            player.clock.stop()
+        code = move.getCode()
+        moves.append(code)
+        scores.append(None if score is None else score if gs.whiteToMove else -score)
+        gs.pushMove(code)
+
+    for player in players:
+        player.close()
+    return {'round': number, 'white': whiteConfig['name'], 'black': blackConfig['name'], 'fen': fen,
+            'moves': moves, 'result': result, 'reason': reason, 'termination': termination or 'normal'}
+
+def loadOpenings(path):
+    #FEN or EPD lines - EPD operations after the first four fields are dropped
+    openings = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or line.startswith('#'):
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                fields = fields[:6]
+            else:
+                fields = fields[:4]
+            #parsed and written back, so the PGN gets all six fields - raises ValueError on a broken line
+            openings.append(chessengine.GameState.fromFen(' '.join(fields)).getFen())
+    return openings
+
+'''
+PGN
+'''
+def formatPgn(game, event):
+    headers = {'Event': event, 'Site': '?', 'Date': time.strftime('%Y.%m.%d'), 'Round': str(game['round']),
+               'White': game['white'], 'Black': game['black']}
+    if game['fen'] != chessengine.STARTING_FEN:
+        headers['FEN'] = game['fen']
+    headers['Termination'] = game['termination']
+    pgnGame = chesspgn.PgnGame(headers)
+    pgnGame.moves = game['moves']
+    pgnGame.result = game['result']
+    pgnGame.comment = game['reason']
+    return chesspgn.formatGame(pgnGame)
+
+'''
+Statistics
+Elo from the score fraction of the first engine, with the error bar from the variance of the
+game results (draws make the results less spread, so they narrow it).
+The SPRT is the generalized test of Michel Van den Bergh, as used by Fishtest: the log-likelihood
+ratio of elo1 against elo0 under a normal approximation of the game results.
+'''
+def eloFromScore(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400*math.log10(1/score - 1)
+
+def scoreFromElo(elo):
+    return 1 / (1 + 10**(-elo / 400))
+
+def resultStats(wins, draws, losses):
+    '''
+    (score, variance) of the first engine - the mean of its game results (1, 1/2, 0) and their
+    variance per game.
+    '''
+    games = wins + draws + losses
+    score = (wins + draws/2) / games
+    variance = (wins*(1 - score)**2 + draws*(0.5 - score)**2 + losses*score**2) / games
+    return score, variance
+
+def eloEstimate(wins, draws, losses):
+    #(elo, error) - the 95% interval is elo - error to elo + error, near enough for small differences
+    games = wins + draws + losses
+    score, variance = resultStats(wins, draws, losses)
+    margin = 1.96*math.sqrt(variance / games)
+    low = eloFromScore(score - margin)
+    high = eloFromScore(score + margin)
+    return eloFromScore(score), (high - low) / 2
+
+def likelihoodOfSuperiority(wins, losses):
+    if wins + losses == 0:
+        return 0.5
+    return 0.5*(1 + math.erf((wins - losses) / math.sqrt(2*(wins + losses))))
+
+def sprtLlr(wins, draws, losses, elo0, elo1):
+    #log-likelihood ratio of elo1 against elo0, 0 until the results vary
+    games = wins + draws + losses
+    score, variance = resultStats(wins, draws, losses)
+    if variance == 0:
+        return 0.0
+    s0 = scoreFromElo(elo0)
+    s1 = scoreFromElo(elo1)
+    return games*(s1 - s0)*(2*score - s0 - s1) / (2*variance)
+
+def sprtBounds(alpha, beta):
+    #the llr at or below which H0 is accepted, and at or above which H1 is
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+'''
+Match
+'''
+def runMatch(configs, openings, games, concurrency, pgnPath=None, tablebasePath=None, sprt=None, seed=None, event='chessbot match'):
+    '''
+    Plays up to games games and returns (wins, draws, losses) of configs[0]. Pairs of games share
+    an opening with the colours swapped. sprt is (elo0, elo1, alpha, beta) or None.
+    '''
+    rng = random.Random(seed)
+    wins = draws = losses = 0
+    if sprt is not None:
+        lower, upper = sprtBounds(sprt[2], sprt[3])
+    pgn = open(pgnPath, 'a') if pgnPath else None
+    started = time.time()
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=concurrency, initializer=initWorker, initargs=(tablebasePath,))
+    pending = set()
+    nextGame = 0
+    finished = 0
+    try:
+        while finished < games:
+            #only a few games are queued ahead, so an SPRT stop doesn't wait on thousands
+            while nextGame < games and len(pending) < 2*concurrency:
+                first = nextGame % 2 == 0 #configs[0] plays white in the first game of a pair
+                fen = openings[(nextGame // 2) % len(openings)]
+                white, black = (configs[0], configs[1]) if first else (configs[1], configs[0])
+                pending.add(pool.submit(playGame, nextGame + 1, white, black, fen, rng.getrandbits(32)))
+                nextGame += 1
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                game = future.result()
+                finished += 1
+                if game['result'] == '1/2-1/2':
+                    draws += 1
+                elif (game['result'] == '1-0') == (game['white'] == configs[0]['name']):
+                    wins += 1
+                else:
+                    losses += 1
+                if pgn is not None:
+                    pgn.write(formatPgn(game, event))
+                    pgn.flush()
+                elo, error = eloEstimate(wins, draws, losses)
+                line = ('%d games  +%d =%d -%d  elo %+.1f +/- %.1f  los %.1f%%  %.1fs'
+                        % (finished, wins, draws, losses, elo, error, 100*likelihoodOfSuperiority(wins, losses), time.time() - started))
+                if sprt is not None:
+                    llr = sprtLlr(wins, draws, losses, sprt[0], sprt[1])
+                    line += '  llr %.2f (%.2f, %.2f)' % (llr, lower, upper)
+                print(line)
+                if sprt is not None and (llr <= lower or llr >= upper):
+                    print('SPRT: H1 accepted, elo >= %g' % sprt[1] if llr >= upper else 'SPRT: H0 accepted, elo <= %g' % sprt[0])
+                    return wins, draws, losses
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.shutdown(wait=True, cancel_futures=True)
+        if pgn is not None:
+            pgn.close()
+    return wins, draws, losses
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Self-play match between two engine configurations')
+    parser.add_argument('-e', '--engine', nargs='+', action='append', metavar=('NAME', 'KEY=VALUE'), required=True,
+                        help='an engine, give it twice')
+    parser.add_argument('--each', nargs='+', default=[], metavar='KEY=VALUE', help='options for both engines')
+    parser.add_argument('-g', '--games', type=int, default=100)
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='games played at once, one process each')
+    parser.add_argument('--openings', help='FEN or EPD file of start positions, default is the start position')
+    parser.add_argument('--pgn', help='file the games are appended to')
+    parser.add_argument('--tablebases', help='directory of tables made by chesstablebase.py, for adjudication and play')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'), help='stop when the SPRT decides')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if len(args.engine) != 2:
+        parser.error('give exactly two engines')
+    try:
+        configs = [parseEngine(tokens, args.each) for tokens in args.engine]
+        openings = loadOpenings(args.openings) if args.openings else [chessengine.STARTING_FEN]
+    except (ValueError, OSError) as e:
+        parser.error(str(e))
+    if configs[0]['name'] == configs[1]['name']:
+        parser.error('the engines need different names')
+    if not openings:
+        parser.error('no positions in ' + args.openings)
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    runMatch(configs, openings, args.games, max(1, args.concurrency), args.pgn, args.tablebases, sprt, args.seed)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+'''
+Perft - counts the leaf nodes of the legal move tree to a fixed depth.
+The counts are compared with published reference values, so any move generator change
+that breaks a rule (castling, en passant, promotion, pins) shows up as a wrong number.
+It also reports the time and nodes per second of each depth, which makes it the benchmark
+for move generator speed.
+
+python chessperft.py                        run the whole suite to depth 3, and the bad FEN checks
+python chessperft.py -d 4 -p kiwipete       one position, deeper
+python chessperft.py --fen "<fen>" -d 3 --divide
+'''
+import argparse
+import sys
+import time
+
+import chessengine
+
+#name, fen, reference node counts for depth 1, 2, 3...
+positions = [
+    ("startpos", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     [20, 400, 8902, 197281, 4865609]),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     [48, 2039, 97862, 4085603]),
+    ("endgame", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     [14, 191, 2812, 43238, 674624]),
+    ("promotion", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     [6, 264, 9467, 422333]),
+    ("promotion-checks", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     [44, 1486, 62379, 2103487]),
+    ("middlegame", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     [46, 2079, 89890, 3894594]),
+    #en passant captures that are illegal because they expose the king
+    ("enpassant-pin", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     [18, 92, 1670, 10138, 185429, 1134888]),
+    ("enpassant-discovered", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     [13, 102, 1266, 10276, 135655, 1015133]),
+    ("enpassant-check", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     [15, 126, 1928, 13931, 206379, 1440467]),
+    ("underpromotion", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     [6, 27, 273, 1329, 18135, 92683]),
+]
+
+#positions GameState must refuse with a ValueError
+badFens = [
+    ("castling-without-rook", "4k3/8/8/8/8/8/8/4K3 w K - 0 1"),
+    ("castling-king-moved", "r3k2r/8/8/8/8/8/8/R4K1R w KQkq - 0 1"),
+    ("castling-letter", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkx - 0 1"),
+    ("enpassant-square", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq z9 0 1"),
+    ("enpassant-rank", "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e6 0 1"),
+    ("enpassant-no-pawn", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR b KQkq e3 0 1"),
+    ("pawn-first-rank", "4k3/8/8/8/8/8/8/P3K3 w - - 0 1"),
+    ("pawn-last-rank", "4k2p/8/8/8/8/8/8/4K3 b - - 0 1"),
+    ("opponent-in-check", "4k3/4R3/8/8/8/8/8/4K3 w - - 0 1"),
+    ("two-white-kings", "4k3/8/8/8/8/8/8/K3K3 w - - 0 1"),
+    ("short-rank", "4k3/8/8/8/8/8/8/4K2 w - - 0 1"),
+]
+
+'''
+Counting
+perft runs on the packed moves the search uses, perftObjects on the Move objects
+and makeMove/undoMove of the GUI. Both must give the same counts.
+'''
+def perft(gs, depth):
+    moves = gs.generateMoves()
+    if depth == 1: #bulk count - no need to make the last ply
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.pushMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.popMove()
+    return nodes
+
+def perftObjects(gs, depth):
+    moves = gs.getValidMoves()
+    if depth == 1: #bulk count - no need to make the last ply
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perftObjects(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+def divide(gs, depth):
+    #node count below each root move, to find the move where two generators disagree
+    total = 0
+    moves = gs.generateMoves()
+    for move in moves:
+        gs.pushMove(move)
+        nodes = perft(gs, depth - 1) if depth > 1 else 1
+        gs.popMove()
+        print(chessengine.moveToUci(move) + ': ' + str(nodes))
+        total += nodes
+    print('\nMoves: ' + str(len(moves)))
+    print('Nodes: ' + str(total))
+    return total
+
+def runPosition(name, fen, depth, expected=None, count=perft):
+    #perft for every depth up to depth, returns False if any count differs from the reference
+    gs = chessengine.GameState.fromFen(fen)
+    passed = True
+    print(name + '  ' + fen)
+    for d in range(1, depth + 1):
+        start = time.perf_counter()
+        nodes = count(gs, d)
+        elapsed = time.perf_counter() - start
+        nps = int(nodes / elapsed) if elapsed > 0 else 0
+        line = '  depth %d  nodes %10d  time %8.3fs  nps %9d' % (d, nodes, elapsed, nps)
+        if expected is not None and d <= len(expected):
+            if nodes == expected[d-1]:
+                line += '  ok'
+            else:
+                line += '  FAILED, expected %d' % expected[d-1]
+                passed = False
+        print(line)
+    return passed
+
+def checkFens():
+    #the FEN parser has to refuse every bad position, returns the names of the ones it took
+    accepted = []
+    for name, fen in badFens:
+        try:
+            chessengine.GameState.fromFen(fen)
+        except ValueError:
+            continue
+        print('bad FEN accepted: ' + name + '  ' + fen)
+        accepted.append('fen ' + name)
+    return accepted
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Perft node counts and move generator benchmark')
+    parser.add_argument('-d', '--depth', type=int, default=3)
+    parser.add_argument('-p', '--position', help='name of a suite position, default is every position',
+                        choices=[name for name, fen, counts in positions])
+    parser.add_argument('--fen', help='any position, counts are not checked')
+    parser.add_argument('--divide', action='store_true', help='print the node count below each root move')
+    parser.add_argument('--objects', action='store_true', help='count through getValidMoves and makeMove instead of packed moves')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        selected = [('fen', args.fen, None)]
+    else:
+        selected = [p for p in positions if args.position is None or p[0] == args.position]
+
+    if args.divide:
+        passed = True
+        for name, fen, expected in selected:
+            print(name + '  ' + fen)
+            nodes = divide(chessengine.GameState.fromFen(fen), args.depth)
+            if expected is not None and args.depth <= len(expected) and nodes != expected[args.depth-1]:
+                print('FAILED, expected ' + str(expected[args.depth-1]))
+                passed = False
+        return 0 if passed else 1
+
+    failed = [] if args.fen or args.position else checkFens()
+    start = time.perf_counter()
+    for name, fen, expected in selected:
+        if not runPosition(name, fen, args.depth, expected, perftObjects if args.objects else perft):
+            failed.append(name)
+    print('\nTotal time %.3fs' % (time.perf_counter() - start))
+    if failed:
+        print('FAILED: ' + ', '.join(failed))
+        return 1
+    print('All counts match')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
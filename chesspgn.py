@@ -0,0 +1,241 @@
+'''
+PGN - reads and writes games in Portable Game Notation.
+
+readGames streams the games of a file one at a time, reading it line by line, so a file of
+any size goes through in the memory of one game. Every move is replayed on a GameState as it
+is read; a move that isn't legal there ends the game's moves and is recorded in game.error,
+and the reader carries on with the next game. Comments, variations and NAGs are skipped.
+formatGame writes a game back out in full SAN, with check, mate and disambiguation.
+
+python chesspgn.py games.pgn              count the games, moves and errors of a file
+python chesspgn.py games.pgn -o out.pgn   and write the good games out again, normalized
+'''
+import argparse
+import re
+import sys
+import time
+
+import chessengine
+
+SEVEN_TAGS = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+TAG_DEFAULTS = {'Date': '????.??.??', 'Result': '*'}
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+LINE_LENGTH = 80 #PGN export format keeps lines under this
+
+class PgnGame():
+    def __init__(self, headers=None):
+        self.headers = dict(headers or {}) #tag name -> value, in file order
+        self.moves = [] #packed moves, from the start position
+        self.result = self.headers.get('Result', '*')
+        self.comment = None #written after the last move, e.g. why the game ended
+        self.error = None #what was wrong with the movetext, None when every move was legal
+        self.position = None #GameState after the last move, set by readGames
+
+    def startFen(self):
+        return self.headers.get('FEN', chessengine.STARTING_FEN)
+
+    def replay(self):
+        #GameState at the end of the game
+        gs = chessengine.GameState.fromFen(self.startFen())
+        for code in self.moves:
+            gs.pushMove(code)
+        return gs
+
+def gameFromState(gs, headers=None, result='*', comment=None):
+    #PgnGame of a GameState played with makeMove from the start position
+    game = PgnGame(headers)
+    game.moves = [move.getCode() for move in gs.moveLog]
+    game.result = result
+    game.comment = comment
+    return game
+
+'''
+Reading
+A line holds tags or movetext; movetext is split into tokens by TOKEN. A comment in braces
+can run over several lines, inComment carries it to the next one.
+'''
+TAG = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]$') #to the last quote, some writers don't escape the ones inside
+TOKEN = re.compile(r'\{[^}]*\}?|;.*|\(|\)|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[^\s(){};.$]+')
+ESCAPE = re.compile(r'\\(.)')
+
+class _Reader():
+    #the state of readGames between lines
+    def __init__(self):
+        self.game = None
+        self.position = None
+        self.inMovetext = False
+        self.variation = 0 #depth of the ( ) being skipped
+        self.inComment = False
+
+    def tag(self, name, value):
+        if self.game is None:
+            self.game = PgnGame()
+        self.game.headers[name] = value
+        if name == 'Result':
+            self.game.result = value
+
+    def token(self, token):
+        #one movetext token, returns the finished game after a result
+        if self.game is None:
+            self.game = PgnGame()
+        game = self.game
+        self.inMovetext = True
+        first = token[0]
+        if first == '{' or first == ';' or first == '$':
+            return None
+        if token == '(':
+            self.variation += 1
+            return None
+        if token == ')':
+            self.variation = max(self.variation - 1, 0)
+            return None
+        if self.variation:
+            return None
+        if token in RESULTS:
+            game.result = token
+            return self.finish()
+        if first.isdigit() and token[-1] == '.':
+            return None #move number
+        if game.error is not None:
+            return None
+        if self.position is None:
+            try:
+                self.position = chessengine.GameState.fromFen(game.startFen())
+            except ValueError as e:
+                game.error = 'bad FEN: ' + str(e)
+                return None
+        code = chessengine.sanToCode(self.position, token)
+        if code is None:
+            game.error = 'illegal move %s at ply %d' % (token, len(game.moves) + 1)
+            return None
+        self.position.pushMove(code)
+        game.moves.append(code)
+        return None
+
+    def finish(self):
+        game = self.game
+        if game.position is None:
+            game.position = self.position if self.position is not None else _startPosition(game)
+        self.game = None
+        self.position = None
+        self.inMovetext = False
+        self.variation = 0
+        return game
+
+def _startPosition(game):
+    try:
+        return chessengine.GameState.fromFen(game.startFen())
+    except ValueError as e:
+        game.error = 'bad FEN: ' + str(e)
+        return None
+
+def readGames(f):
+    '''
+    Yields every game of the open text file f as a PgnGame with its headers, its moves as packed
+    moves and the position it ends in. A game with a move that can't be played has error set
+    and the moves before it.
+    '''
+    reader = _Reader()
+    for line in f:
+        if reader.inComment:
+            end = line.find('}')
+            if end < 0:
+                continue
+            line = line[end + 1:]
+            reader.inComment = False
+        elif line.startswith('%'): #escape line
+            continue
+        stripped = line.strip()
+        if stripped.startswith('[') and not reader.variation:
+            match = TAG.match(stripped)
+            if match:
+                if reader.inMovetext: #no result token, the tags start the next game
+                    yield reader.finish()
+                reader.tag(match.group(1), ESCAPE.sub(r'\1', match.group(2)))
+                continue
+        for token in TOKEN.findall(line):
+            if token[0] == '{' and token[-1] != '}':
+                reader.inComment = True
+                break
+            game = reader.token(token)
+            if game is not None:
+                yield game
+    if reader.game is not None:
+        yield reader.finish()
+
+'''
+Writing
+'''
+def formatGame(game):
+    #the PGN text of game: the seven tag roster, the other tags, and the moves in full SAN
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+    lines = []
+    for name in SEVEN_TAGS:
+        lines.append(_formatTag(name, headers.pop(name, TAG_DEFAULTS.get(name, '?'))))
+    fen = headers.pop('FEN', None)
+    headers.pop('SetUp', None)
+    for name, value in headers.items():
+        lines.append(_formatTag(name, value))
+    if fen is not None and fen != chessengine.STARTING_FEN:
+        lines.append(_formatTag('SetUp', '1'))
+        lines.append(_formatTag('FEN', fen))
+    lines.append('')
+
+    gs = chessengine.GameState.fromFen(game.startFen())
+    tokens = []
+    for i, code in enumerate(game.moves):
+        if gs.whiteToMove:
+            tokens.append(str(gs.fullmoveNumber) + '.')
+        elif i == 0:
+            tokens.append(str(gs.fullmoveNumber) + '...')
+        tokens.append(chessengine.moveToSan(gs, code))
+        gs.pushMove(code)
+    if game.comment:
+        tokens.append('{' + game.comment.replace('}', ')') + '}')
+    tokens.append(game.result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + ' ' + token if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
+
+def _formatTag(name, value):
+    return '[%s "%s"]' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+
+def writeGame(f, game):
+    f.write(formatGame(game))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Read a PGN file and check every move')
+    parser.add_argument('pgn')
+    parser.add_argument('-o', '--output', help='write the games without errors here')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    games = moves = errors = 0
+    output = open(args.output, 'w') if args.output else None
+    try:
+        with open(args.pgn, errors='replace') as f:
+            for game in readGames(f):
+                games += 1
+                moves += len(game.moves)
+                if game.error is not None:
+                    errors += 1
+                    print('game %d (%s - %s): %s' % (games, game.headers.get('White', '?'), game.headers.get('Black', '?'), game.error))
+                elif output is not None:
+                    writeGame(output, game)
+    finally:
+        if output is not None:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print('%d games, %d moves, %d with errors  %.1fs  %d moves/s' % (games, moves, errors, elapsed, moves / max(elapsed, 1e-9)))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+'''
+Endgame tablebases - exact results for king and one piece against a lone king (KQK, KRK, KPK).
+The generator works backwards from the mates (retrograde analysis), so each position is looked at
+a few times instead of being searched. Every table is written to a bit-packed file which the
+probe memory maps - a lookup reads two bytes.
+
+python chesstablebase.py                     generate every table into tablebases/
+python chesstablebase.py -o dir kqk krk      only some, somewhere else
+
+Tables are stored with the side that has the piece as white. The index of a position is
+((stm*64 + strongKing)*64 + weakKing)*64 + piece, stm 0 when the strong side is to move.
+The value is 0 for a draw (or a position that can't happen) and otherwise the distance to mate
+in plies + 1. With one piece only the strong side can win, so the side to move is the winner
+when stm is 0 and the loser when stm is 1.
+'''
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from chessbitboard import (WHITE, BLACK, WP, WN, WB, WR, WQ, WK, BK, KING_ATTACKS, PAWN_ATTACKS,
+                           rookAttacks, queenAttacks, lsb, popcount, squares)
+
+MAGIC = b'CTB1'
+HEADER_SIZE = 8 #magic, bits per value, 3 bytes unused
+TABLE_SIZE = 2*64*64*64
+TABLES = {'kqk': WQ, 'krk': WR, 'kpk': WP}
+#the tables a table promotes into, they have to be generated first
+PROMOTIONS = {'kpk': ('kqk', 'krk')}
+
+def index(stm, strongKing, weakKing, piece):
+    return ((stm*64 + strongKing)*64 + weakKing)*64 + piece
+
+def pieceAttacks(piece, sq, occ):
+    if piece == WQ:
+        return queenAttacks(sq, occ)
+    if piece == WR:
+        return rookAttacks(sq, occ)
+    return PAWN_ATTACKS[WHITE][sq]
+
+'''
+Generator
+'''
+def _legalSquares(piece, strongKing, weakKing, sq):
+    #the three pieces on different squares, kings apart and no pawn on the first or last rank
+    if sq == strongKing or sq == weakKing or strongKing == weakKing:
+        return False
+    if KING_ATTACKS[strongKing] >> weakKing & 1:
+        return False
+    return piece != WP or 8 <= sq < 56
+
+def _weakMoves(piece, strongKing, weakKing, sq):
+    '''
+    Looks at the lone king's moves. Returns (moves, escape, inCheck): the number of moves that
+    keep the piece on the board, whether it can take the piece, and whether it is in check.
+    '''
+    occ = 1 << strongKing | 1 << weakKing | 1 << sq
+    inCheck = pieceAttacks(piece, sq, occ) >> weakKing & 1 == 1
+    moves = 0
+    escape = False
+    for to in squares(KING_ATTACKS[weakKing]):
+        if to == strongKing or KING_ATTACKS[strongKing] >> to & 1:
+            continue
+        if to == sq:
+            escape = True #not defended by the king, checked above
+            continue
+        if pieceAttacks(piece, sq, occ ^ (1 << weakKing) | (1 << to)) >> to & 1:
+            continue
+        moves += 1
+    return moves, escape, inCheck
+
+def _pieceOrigins(piece, strongKing, weakKing, sq):
+    #squares the piece can have come from to reach sq, not capturing
+    occ = 1 << strongKing | 1 << weakKing | 1 << sq
+    if piece == WP:
+        origins = []
+        behind = sq + 8
+        if behind < 56 and not occ >> behind & 1:
+            origins.append(behind)
+            if sq >> 3 == 4 and not occ >> (behind + 8) & 1: #double push from the second rank
+                origins.append(behind + 8)
+        return origins
+    return squares(pieceAttacks(piece, sq, occ) & ~occ)
+
+def generate(piece, promotions=()):
+    '''
+    Distance to mate of every position of king and piece against king, as a bytearray of
+    plies + 1 (0 for draws). promotions are the (piece, table) pairs a pawn can promote into.
+    '''
+    values = bytearray(TABLE_SIZE)
+    degree = [0]*(TABLE_SIZE // 2) #lone king to move: moves not yet known to lose, -1 when it holds
+    buckets = {} #plies -> positions resolved at that distance
+
+    def resolve(i, plies):
+        values[i] = plies + 1
+        buckets.setdefault(plies, []).append(i)
+
+    for strongKing in range(64):
+        for weakKing in range(64):
+            for sq in range(64):
+                if not _legalSquares(piece, strongKing, weakKing, sq):
+                    continue
+                i = index(1, strongKing, weakKing, sq) - TABLE_SIZE // 2
+                moves, escape, inCheck = _weakMoves(piece, strongKing, weakKing, sq)
+                if escape or (moves == 0 and not inCheck): #takes the piece or stalemate
+                    degree[i] = -1
+                elif moves == 0:
+                    degree[i] = 0
+                    resolve(i + TABLE_SIZE // 2, 0) #mate
+                else:
+                    degree[i] = moves
+
+                #promotions are looked up in the finished tables
+                if piece == WP and sq >> 3 == 1 and not (1 << strongKing | 1 << weakKing) >> (sq - 8) & 1:
+                    occ = 1 << strongKing | 1 << weakKing | 1 << sq
+                    if pieceAttacks(piece, sq, occ) >> weakKing & 1:
+                        continue #illegal with the strong side to move
+                    best = None
+                    for promoted, table in promotions:
+                        value = table[index(1, strongKing, weakKing, sq - 8)]
+                        if value and (best is None or value < best):
+                            best = value
+                    if best is not None:
+                        resolve(index(0, strongKing, weakKing, sq), best) #the lost position's plies + 1
+
+    plies = 0
+    while plies <= max(buckets, default=-1):
+        for i in buckets.pop(plies, ()):
+            if values[i] != plies + 1:
+                continue #found shorter later by another route
+            stm, rest = divmod(i, 64*64*64)
+            strongKing, rest = divmod(rest, 64*64)
+            weakKing, sq = divmod(rest, 64)
+            if stm == 1:
+                #lost for the lone king - every strong move into it wins one ply further away
+                for origin in squares(KING_ATTACKS[strongKing]):
+                    if origin != weakKing and origin != sq and not KING_ATTACKS[origin] >> weakKing & 1:
+                        _strongPredecessor(values, piece, origin, weakKing, sq, plies + 1, resolve)
+                for origin in _pieceOrigins(piece, strongKing, weakKing, sq):
+                    _strongPredecessor(values, piece, strongKing, weakKing, origin, plies + 1, resolve)
+            else:
+                #won for the strong side - the lone king only loses when all its moves lead to wins
+                for origin in squares(KING_ATTACKS[weakKing]):
+                    if origin == strongKing or origin == sq or KING_ATTACKS[strongKing] >> origin & 1:
+                        continue
+                    j = index(1, strongKing, origin, sq)
+                    d = j - TABLE_SIZE // 2
+                    if degree[d] > 0:
+                        degree[d] -= 1
+                        if degree[d] == 0:
+                            resolve(j, plies + 1)
+        plies += 1
+    return values
+
+def _strongPredecessor(values, piece, strongKing, weakKing, sq, plies, resolve):
+    #strong side to move, wins in plies if the position is legal and not already quicker
+    if piece == WP and not 8 <= sq < 56:
+        return
+    occ = 1 << strongKing | 1 << weakKing | 1 << sq
+    if pieceAttacks(piece, sq, occ) >> weakKing & 1:
+        return #the lone king would be in check with the strong side to move
+    i = index(0, strongKing, weakKing, sq)
+    if values[i] == 0 or values[i] > plies + 1:
+        resolve(i, plies)
+
+'''
+File format - a header, then the values packed bits at a time, lowest bit first
+'''
+def writeTable(path, values):
+    bits = max(values).bit_length() or 1
+    packed = bytearray((len(values)*bits + 7) // 8 + 1) #one spare byte so a probe can always read two
+    offset = 0
+    for value in values:
+        if value:
+            packed[offset >> 3] |= (value << (offset & 7)) & 0xFF
+            packed[(offset >> 3) + 1] |= value << (offset & 7) >> 8
+        offset += bits
+    with open(path, 'wb') as f:
+        f.write(MAGIC + bytes([bits, 0, 0, 0]))
+        f.write(packed)
+
+class Table():
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != MAGIC:
+            raise ValueError(path + ' is not a tablebase file')
+        self.bits = self.map[4]
+        self.mask = (1 << self.bits) - 1
+
+    def __getitem__(self, i):
+        offset = i*self.bits
+        byte = HEADER_SIZE + (offset >> 3)
+        return (self.map[byte] | self.map[byte + 1] << 8) >> (offset & 7) & self.mask
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+'''
+Probing
+'''
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+class Tablebases():
+    def __init__(self, directory):
+        self.directory = directory #where the tables are, so another process can open them too
+        self.tables = {} #strong piece index (white) -> Table
+        for name, piece in TABLES.items():
+            path = os.path.join(directory, name + '.bin')
+            if os.path.isfile(path):
+                self.tables[piece] = Table(path)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+
+    def probe(self, gs):
+        '''
+        (result, plies) for the side to move - WIN, DRAW or LOSS and the plies to mate -
+        or None when the position isn't in a table.
+        '''
+        occ = gs.colourBB[WHITE] | gs.colourBB[BLACK]
+        pieces = popcount(occ)
+        if pieces == 2:
+            return DRAW, 0
+        if pieces != 3 or gs.castling:
+            return None
+        pieceBB = gs.pieceBB
+        if gs.colourBB[WHITE] & ~pieceBB[WK]:
+            strong = WHITE
+            sq = lsb(gs.colourBB[WHITE] & ~pieceBB[WK])
+            piece = gs.mailbox[sq]
+            flip = 0
+        else:
+            strong = BLACK
+            sq = lsb(gs.colourBB[BLACK] & ~pieceBB[BK])
+            piece = gs.mailbox[sq] - 6 #the same piece as white
+            flip = 56 #sq ^ 56 mirrors the board top to bottom
+        if piece == WN or piece == WB:
+            return DRAW, 0 #a lone minor piece can't mate
+        table = self.tables.get(piece)
+        if table is None:
+            return None
+        strongKing = lsb(pieceBB[WK if strong == WHITE else BK])
+        weakKing = lsb(pieceBB[BK if strong == WHITE else WK])
+        stm = 0 if gs.whiteToMove == (strong == WHITE) else 1
+        value = table[index(stm, strongKing ^ flip, weakKing ^ flip, sq ^ flip)]
+        if value == 0:
+            return DRAW, 0
+        return (WIN if stm == 0 else LOSS), value - 1
+
+def openTablebases(directory):
+    #the tables found in directory, None if there are none
+    if directory is None or not os.path.isdir(directory):
+        return None
+    tablebases = Tablebases(directory)
+    if not tablebases.tables:
+        return None
+    return tablebases
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate endgame tablebases')
+    parser.add_argument('-o', '--output', default='tablebases')
+    parser.add_argument('tables', nargs='*', help='any of ' + ', '.join(TABLES) + ', default is all of them')
+    args = parser.parse_args(argv)
+    names = args.tables or list(TABLES)
+    for name in names:
+        if name not in TABLES:
+            parser.error('unknown table ' + name)
+    os.makedirs(args.output, exist_ok=True)
+
+    generated = {}
+    for name in TABLES: #in order, a table comes after the ones it promotes into
+        needed = name in names or any(name in PROMOTIONS.get(other, ()) for other in names)
+        if not needed:
+            continue
+        path = os.path.join(args.output, name + '.bin')
+        start = time.perf_counter()
+        promotions = [(TABLES[table], generated[table]) for table in PROMOTIONS.get(name, ())]
+        values = generate(TABLES[name], promotions)
+        generated[name] = values
+        if name in names:
+            writeTable(path, values)
+            wins = sum(1 for i in range(TABLE_SIZE // 2) if values[i])
+            print('%s  %.1fs  longest mate %d plies  %d wins with the piece to move  -> %s'
+                  % (name, time.perf_counter() - start, max(values) - 1, wins, path))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,252 @@
+'''
+UCI front-end - plays through the Universal Chess Interface on stdin/stdout instead of the
+pygame window, so chess GUIs, servers and match runners can use the engine.
+
+python chessuci.py
+python chessuci.py --book book.bin --tablebases tablebases --threads 4
+
+Commands: uci, isready, ucinewgame, setoption, position (startpos or fen, then moves),
+go (wtime btime winc binc movestogo movetime depth nodes infinite ponder), stop, ponderhit, quit.
+The search runs on its own thread while this one keeps reading commands, so stop is
+acted on at once - the search notices at its next time check and bestmove follows.
+After every finished iteration an info line gives the depth, score, nodes, nps and line.
+'''
+import argparse
+import sys
+import threading
+import time
+
+import chessai
+import chessbook
+import chessclock
+import chessengine
+import chesstablebase
+
+ENGINE_NAME = 'chessbot'
+ENGINE_AUTHOR = 'the chessbot authors'
+
+def scoreToUci(score):
+    #cp for centipawns, or mate in moves - negative when the side to move gets mated
+    if score >= chessai.MATE_BOUND:
+        return 'mate ' + str((chessai.CHECKMATE - score + 1) // 2)
+    if score <= -chessai.MATE_BOUND:
+        return 'mate -' + str((chessai.CHECKMATE + score) // 2)
+    return 'cp ' + str(score)
+
+def parsePosition(tokens):
+    #GameState of the arguments of a position command, the moves made with pushMove
+    if tokens and tokens[0] == 'fen':
+        end = tokens.index('moves') if 'moves' in tokens else len(tokens)
+        gs = chessengine.GameState.fromFen(' '.join(tokens[1:end]))
+    else:
+        gs = chessengine.GameState()
+    if 'moves' in tokens:
+        for uci in tokens[tokens.index('moves') + 1:]:
+            code = uciToCode(gs, uci)
+            if code is None: #an illegal move, the rest can't be played either
+                break
+            gs.pushMove(code)
+    return gs
+
+def uciToCode(gs, uci):
+    #the packed legal move written as uci, or None
+    for code in gs.generateMoves():
+        if chessengine.moveToUci(code) == uci:
+            return code
+    return None
+
+def parseGo(tokens):
+    #the arguments of a go command - flags map to True, the rest to their int value
+    params = {}
+    i = 0
+    while i < len(tokens):
+        name = tokens[i]
+        if name in ('infinite', 'ponder'):
+            params[name] = True
+        elif i + 1 < len(tokens):
+            try:
+                params[name] = int(tokens[i + 1])
+            except ValueError:
+                pass
+            i += 1
+        i += 1
+    return params
+
+class UciEngine():
+    def __init__(self, output, book=None, tablebases=None, workers=1):
+        self.output = output #function that writes one line to the GUI
+        self.outputLock = threading.Lock() #the search thread writes too
+        self.book = book
+        self.tablebases = tablebases
+        self.workers = workers
+        self.evalCache = chessai.EvalCache()
+        self.gs = chessengine.GameState()
+        self.info = None #SearchInfo of the running search
+        self.thread = None
+        self.ponderLimits = None #(soft, hard) for after a ponderhit
+        self.released = threading.Event() #set once bestmove may be sent, a ponder or infinite search waits for it
+
+    def send(self, line):
+        with self.outputLock:
+            self.output(line)
+
+    def handle(self, line):
+        #acts on one command, False after quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == 'uci':
+            self.send('id name ' + ENGINE_NAME)
+            self.send('id author ' + ENGINE_AUTHOR)
+            self.send('option name Ponder type check default false')
+            self.send('option name Threads type spin default ' + str(self.workers) + ' min 1 max 64')
+            self.send('option name BookFile type string default <empty>')
+            self.send('option name TablebasePath type string default <empty>')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self.stopSearch()
+            chessai.transpositionTable.clear()
+            chessai.pawnTable.clear()
+            self.evalCache.clear()
+            self.gs = chessengine.GameState()
+        elif command == 'setoption':
+            self.stopSearch()
+            self.setOption(args)
+        elif command == 'position':
+            self.stopSearch()
+            try:
+                self.gs = parsePosition(args)
+            except ValueError as e: #a broken FEN, keep the position we had
+                self.send('info string ' + str(e))
+        elif command == 'go':
+            self.stopSearch()
+            self.go(parseGo(args))
+        elif command == 'stop':
+            self.stopSearch()
+        elif command == 'ponderhit':
+            self.ponderHit()
+        elif command == 'quit':
+            self.stopSearch()
+            return False
+        #anything else is ignored, as the protocol asks
+        return True
+
+    def setOption(self, args):
+        #setoption name <name> value <value>, names can have spaces
+        if 'name' not in args:
+            return
+        valueAt = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[args.index('name') + 1:valueAt]).lower()
+        value = ' '.join(args[valueAt + 1:])
+        if name == 'threads':
+            self.workers = max(1, int(value))
+        elif name == 'bookfile':
+            if self.book is not None:
+                self.book.close()
+            self.book = chessbook.openBook(value) if value and value != '<empty>' else None
+        elif name == 'tablebasepath':
+            if self.tablebases is not None:
+                self.tablebases.close()
+            self.tablebases = chesstablebase.openTablebases(value) if value and value != '<empty>' else None
+
+    def timeLimits(self, params):
+        #(soft, hard) seconds of a go command, (None, None) when it sets no time
+        if 'movetime' in params:
+            return None, max(params['movetime'] / 1000, chessclock.MIN_MOVE_TIME)
+        white = self.gs.whiteToMove
+        timeLeft = params.get('wtime' if white else 'btime')
+        if timeLeft is None:
+            return None, None
+        increment = params.get('winc' if white else 'binc', 0)
+        return chessclock.allocateTime(timeLeft / 1000, increment / 1000, params.get('movestogo'),
+                                       2*(self.gs.fullmoveNumber - 1) + (0 if white else 1))
+
+    def go(self, params):
+        softTime, hardTime = self.timeLimits(params)
+        depth = params.get('depth')
+        nodes = params.get('nodes')
+        waits = params.get('ponder', False) or params.get('infinite', False)
+        if waits: #no time limit until ponderhit, and bestmove not before ponderhit or stop
+            self.ponderLimits = (softTime, hardTime)
+            softTime = hardTime = None
+            if depth is None:
+                depth = chessai.MAX_DEPTH
+            self.released.clear()
+        else:
+            if depth is None and (hardTime is not None or nodes is not None):
+                depth = chessai.MAX_DEPTH
+            self.released.set()
+        self.info = chessai.SearchInfo()
+        self.info.report = self.report
+        self.thread = threading.Thread(target=self.run, args=(self.gs, self.info, depth, softTime, hardTime, nodes), daemon=True)
+        self.thread.start()
+
+    def run(self, gs, info, depth, softTime, hardTime, nodes):
+        move = chessai.findBestMove(gs, gs.getValidMoves(), depth=depth, moveTime=hardTime, softTime=softTime, nodes=nodes,
+                                    workers=self.workers, info=info, evalCache=self.evalCache,
+                                    book=self.book, tablebases=self.tablebases)
+        self.released.wait()
+        if move is None: #mate or stalemate on the board
+            self.send('bestmove 0000')
+            return
+        line = 'bestmove ' + move.getUciNotation()
+        if len(info.pv) > 1 and info.pv[0] == move.getCode():
+            line += ' ponder ' + chessengine.moveToUci(info.pv[1])
+        self.send(line)
+
+    def report(self, info, score):
+        elapsed = max(time.time() - info.startTime, 0.001)
+        self.send('info depth %d score %s nodes %d nps %d time %d pv %s'
+                  % (info.depth, scoreToUci(score), info.nodes, info.nodes / elapsed, elapsed*1000,
+                     ' '.join(chessengine.moveToUci(move) for move in info.pv)))
+
+    def ponderHit(self):
+        #the expected move was played, the ponder search goes on as the real one
+        if self.info is None or self.released.is_set():
+            return
+        softTime, hardTime = self.ponderLimits
+        if hardTime is not None: #the pondered time counts towards the soft limit, only the hard one is new
+            self.info.softTime = softTime
+            self.info.deadline = time.time() + hardTime
+        self.released.set()
+
+    def stopSearch(self):
+        #ends the running search, it sends its bestmove before this returns
+        if self.thread is None:
+            return
+        self.info.stop()
+        self.released.set()
+        self.thread.join()
+        self.thread = None
+        self.info = None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Play through the UCI protocol on stdin/stdout')
+    parser.add_argument('--book', help='Polyglot opening book')
+    parser.add_argument('--tablebases', help='directory of tables made by chesstablebase.py')
+    parser.add_argument('--threads', type=int, default=1, help='search processes')
+    args = parser.parse_args(argv)
+
+    def output(line):
+        sys.stdout.write(line + '\n')
+        sys.stdout.flush()
+
+    engine = UciEngine(output, chessbook.openBook(args.book) if args.book else None,
+                       chesstablebase.openTablebases(args.tablebases), max(1, args.threads))
+    #read through a file of our own: a search with Threads > 1 forks its worker processes while
+    #this thread waits on stdin, and a forked child closes sys.stdin, which would block on the lock held here
+    commands = open(sys.stdin.fileno(), closefd=False)
+    while True:
+        line = commands.readline()
+        if not line: #the GUI closed the pipe
+            engine.stopSearch()
+            break
+        if not engine.handle(line):
+            break
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())